@@ -1,9 +1,29 @@
 """Contains the arguments parser of the API Exposer"""
 
-from argparse import ArgumentParser
+from argparse import ArgumentParser, ArgumentTypeError
 import logging
+from typing import Tuple
 
-from api_exposer.const import DEFAULT_SERVER_URL, DEFAULT_PORT, FEATURES_JSON_FOLDER
+from api_exposer.const import (
+    DEFAULT_SERVER_URL,
+    DEFAULT_PORT,
+    DEFAULT_SHUTDOWN_TIMEOUT,
+    DEFAULT_HISTORY_RETENTION,
+    DEFAULT_HISTORY_CAPACITY,
+    DEFAULT_SNAPSHOT_FILE,
+    DEFAULT_SNAPSHOT_INTERVAL,
+    DEFAULT_SUBSCRIPTIONS_FILE,
+    FEATURES_JSON_FOLDER)
+
+
+def cluster_retention(value: str) -> Tuple[str, float]:
+    """Parses a ``Cluster=seconds`` argument"""
+    cluster_name, _, seconds = value.partition('=')
+    try:
+        return cluster_name, float(seconds)
+    except ValueError as err:
+        raise ArgumentTypeError(
+            f'expected Cluster=seconds, got {value}') from err
 
 
 def get_argument_parser() -> ArgumentParser:
@@ -13,9 +33,10 @@ def get_argument_parser() -> ArgumentParser:
     parser.add_argument(
         '--server-url',
         type=str,
-        dest='url',
-        default=DEFAULT_SERVER_URL,
-        help=f'the url of the matter server hosted by home-assistant, defaults to {
+        nargs='+',
+        dest='urls',
+        default=[DEFAULT_SERVER_URL],
+        help=f'the urls of the matter servers hosted by home-assistant, one per fabric, defaults to {
             DEFAULT_SERVER_URL}',
     )
     parser.add_argument(
@@ -32,6 +53,59 @@ def get_argument_parser() -> ArgumentParser:
         default=DEFAULT_PORT,
         help=f'the listening port for this server, defaults to {DEFAULT_PORT}',
     )
+    parser.add_argument(
+        '--history-retention',
+        type=cluster_retention,
+        nargs='*',
+        default=[],
+        help='the retention in seconds of the attribute history of a cluster. Example --history-retention OnOff=3600 LevelControl=600',
+    )
+    parser.add_argument(
+        '--history-default-retention',
+        type=float,
+        default=DEFAULT_HISTORY_RETENTION,
+        help=f'the retention in seconds of the attribute history of the other clusters, defaults to {
+            DEFAULT_HISTORY_RETENTION}',
+    )
+    parser.add_argument(
+        '--history-capacity',
+        type=int,
+        default=DEFAULT_HISTORY_CAPACITY,
+        help=f'the maximum number of samples kept per attribute, defaults to {
+            DEFAULT_HISTORY_CAPACITY}',
+    )
+    parser.add_argument(
+        '--snapshot-file',
+        type=str,
+        default=DEFAULT_SNAPSHOT_FILE,
+        help='the fabric snapshot file used for warm restarts, no snapshot if not given',
+    )
+    parser.add_argument(
+        '--snapshot-interval',
+        type=float,
+        default=DEFAULT_SNAPSHOT_INTERVAL,
+        help=f'the interval in seconds between two snapshots, defaults to {
+            DEFAULT_SNAPSHOT_INTERVAL}',
+    )
+    parser.add_argument(
+        '--subscriptions-file',
+        type=str,
+        default=DEFAULT_SUBSCRIPTIONS_FILE,
+        help=f'the SQLite file storing the event subscriptions, defaults to {
+            DEFAULT_SUBSCRIPTIONS_FILE}',
+    )
+    parser.add_argument(
+        '--coalesce-writes',
+        action='store_true',
+        help='coalesces the bursts of attribute writes and level-style commands sent to the same target, only the last one is sent',
+    )
+    parser.add_argument(
+        '--shutdown-timeout',
+        type=float,
+        default=DEFAULT_SHUTDOWN_TIMEOUT,
+        help=f'the seconds given to the in-flight requests and the webhook deliveries to finish on shutdown, defaults to {
+            DEFAULT_SHUTDOWN_TIMEOUT}',
+    )
     parser.add_argument(
         '--log-level',
         type=str,
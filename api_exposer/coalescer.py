@@ -0,0 +1,71 @@
+"""Coalesces the bursts of writes sent to the same target"""
+
+import logging
+from asyncio import CancelledError, Future, Task, create_task, get_running_loop
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Set
+
+Send = Callable[[], Awaitable[Any]]
+
+
+@dataclass
+class _Slot:
+    """The pending write of a target and the requests waiting for it"""
+    pending: Optional[Send] = None
+    waiters: List[Future] = field(default_factory=list)
+
+
+class WriteCoalescer:
+    """
+    Last-write-wins coalescing of the writes sent to the same target.
+    There is at most one write in flight and one pending write per target,
+    a new write replaces the pending one.
+    The superseded requests resolve with the outcome of the write replacing them.
+    """
+
+    def __init__(self):
+        self._slots: Dict[Hashable, _Slot] = {}
+        self._tasks: Set[Task] = set()
+
+    async def submit(self, key: Hashable, send: Send) -> Any:
+        """Schedules ``send`` for the target ``key`` and returns the outcome
+        of the last write sent after it"""
+        future = get_running_loop().create_future()
+        slot = self._slots.get(key, None)
+        if slot is None:
+            slot = _Slot()
+            self._slots[key] = slot
+            task = create_task(self._drain(key, slot))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        elif slot.pending is not None:
+            logging.debug('write to %s superseded', key)
+
+        slot.pending = send
+        slot.waiters.append(future)
+        return await future
+
+    async def _drain(self, key: Hashable, slot: _Slot):
+        """Sends the pending writes of a target one at a time"""
+        try:
+            while slot.pending is not None:
+                send, waiters = slot.pending, slot.waiters
+                slot.pending, slot.waiters = None, []
+                try:
+                    result = await send()
+                except CancelledError:
+                    for waiter in waiters:
+                        waiter.cancel()
+                    raise
+                except Exception as err:  # pylint: disable=broad-exception-caught
+                    for waiter in waiters:
+                        if not waiter.done():
+                            waiter.set_exception(err)
+                else:
+                    for waiter in waiters:
+                        if not waiter.done():
+                            waiter.set_result(result)
+        finally:
+            del self._slots[key]
+            for waiter in slot.waiters:
+                waiter.cancel()
@@ -0,0 +1,242 @@
+"""Builds CHIP cluster commands from json bodies with typed argument coercion"""
+
+import logging
+from enum import Enum
+from inspect import getmembers, isclass
+from types import NoneType
+from typing import Any, Callable, Dict, List, Optional, Union, get_args, get_origin
+
+from chip.clusters import Objects
+from chip.clusters.ClusterObjects import Cluster, ClusterCommand, ClusterObject
+from chip.clusters.Types import Nullable, NullValue
+from chip.tlv import uint
+
+from api_exposer.features import FeatureFilter, ALL_FEATURES
+
+
+Coercer = Callable[[Any], Any]
+
+# the member of the CHIP enums standing for the values they do not know
+UNKNOWN_ENUM_VALUE = 'kUnknownEnumValue'
+
+
+class CommandArgumentError(ValueError):
+    """Raised when a json value can not be coerced into a command argument"""
+
+
+def _coerce_int(value: Any) -> int:
+    if isinstance(value, bool):
+        raise CommandArgumentError(f'expected an integer, got {value!r}')
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str):
+        try:
+            return int(value, 0)
+        except ValueError:
+            pass
+    raise CommandArgumentError(f'expected an integer, got {value!r}')
+
+
+def _coerce_uint(value: Any) -> int:
+    result = _coerce_int(value)
+    if result < 0:
+        raise CommandArgumentError(
+            f'expected an unsigned integer, got {value!r}')
+    return result
+
+
+def _coerce_float(value: Any) -> float:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            pass
+    raise CommandArgumentError(f'expected a number, got {value!r}')
+
+
+def _coerce_bool(value: Any) -> bool:
+    if isinstance(value, bool):
+        return value
+    if value in ('true', 'false'):
+        return value == 'true'
+    raise CommandArgumentError(f'expected a boolean, got {value!r}')
+
+
+def _coerce_str(value: Any) -> str:
+    if isinstance(value, str):
+        return value
+    raise CommandArgumentError(f'expected a string, got {value!r}')
+
+
+def _coerce_bytes(value: Any) -> bytes:
+    """Accepts an hexadecimal string or a list of bytes"""
+    try:
+        if isinstance(value, str):
+            return bytes.fromhex(value)
+        if isinstance(value, list):
+            return bytes(value)
+    except (ValueError, TypeError):
+        pass
+    raise CommandArgumentError(
+        f'expected an hexadecimal string, got {value!r}')
+
+
+def _enum_coercer(enum_class: type[Enum]) -> Coercer:
+    """Accepts the value or the name of a member.
+    The CHIP enums map any unknown value to kUnknownEnumValue,
+    so the members are looked up instead of calling the enum."""
+    members = {
+        name: member
+        for name, member in enum_class.__members__.items()
+        if name != UNKNOWN_ENUM_VALUE}
+    values = {member.value: member for member in members.values()}
+
+    def coerce(value: Any) -> Enum:
+        if isinstance(value, str) and value in members:
+            return members[value]
+        try:
+            member = values.get(_coerce_int(value), None)
+        except CommandArgumentError:
+            member = None
+        if member is None:
+            raise CommandArgumentError(
+                f'expected a {enum_class.__name__} value, got {value!r}')
+        return member
+    return coerce
+
+
+def _list_coercer(item_type: Any) -> Coercer:
+    coerce_item = build_coercer(item_type)
+
+    def coerce(value: Any) -> List[Any]:
+        if not isinstance(value, list):
+            raise CommandArgumentError(f'expected a list, got {value!r}')
+        result = []
+        for index, item in enumerate(value):
+            try:
+                result.append(coerce_item(item))
+            except CommandArgumentError as err:
+                raise CommandArgumentError(f'[{index}]: {err}') from err
+        return result
+    return coerce
+
+
+def _union_coercer(types: tuple) -> Coercer:
+    """Handles the Optional and Nullable fields"""
+    is_nullable = Nullable in types
+    is_optional = NoneType in types
+    coercers = [
+        build_coercer(union_type)
+        for union_type in types
+        if union_type not in (Nullable, NoneType)]
+
+    def coerce(value: Any) -> Any:
+        if value is None:
+            if is_nullable:
+                return NullValue
+            if is_optional:
+                return None
+            raise CommandArgumentError('value can not be null')
+        errors = []
+        for coerce_type in coercers:
+            try:
+                return coerce_type(value)
+            except CommandArgumentError as err:
+                errors.append(str(err))
+        raise CommandArgumentError(' or '.join(errors))
+    return coerce
+
+
+def _object_coercer(object_class: type[ClusterObject]) -> Coercer:
+    """Coerces a json object into a struct or a command"""
+    fields: Dict[str, Coercer] = {
+        field.Label: build_coercer(field.Type)
+        for field in object_class.descriptor.Fields}
+
+    def coerce(value: Any) -> ClusterObject:
+        if not isinstance(value, dict):
+            raise CommandArgumentError(f'expected an object, got {value!r}')
+        unknown = value.keys() - fields.keys()
+        if unknown:
+            raise CommandArgumentError(
+                f'unknown fields {", ".join(sorted(unknown))}')
+        arguments = {}
+        for label, field_value in value.items():
+            try:
+                arguments[label] = fields[label](field_value)
+            except CommandArgumentError as err:
+                raise CommandArgumentError(f'{label}: {err}') from err
+        return object_class(**arguments)
+    return coerce
+
+
+def build_coercer(field_type: Any) -> Coercer:
+    """Returns a function coercing a json value into ``field_type``"""
+    origin = get_origin(field_type)
+    if origin is Union:
+        return _union_coercer(get_args(field_type))
+    if origin in (list, List):
+        return _list_coercer(get_args(field_type)[0])
+    if not isclass(field_type):
+        logging.debug('no coercion for type %s', field_type)
+        return lambda value: value
+    if issubclass(field_type, Enum):
+        return _enum_coercer(field_type)
+    if issubclass(field_type, ClusterObject):
+        return _object_coercer(field_type)
+    if issubclass(field_type, bool):
+        return _coerce_bool
+    if issubclass(field_type, uint):
+        return _coerce_uint
+    if issubclass(field_type, int):
+        return _coerce_int
+    if issubclass(field_type, float):
+        return _coerce_float
+    if issubclass(field_type, str):
+        return _coerce_str
+    if issubclass(field_type, bytes):
+        return _coerce_bytes
+    logging.debug('no coercion for type %s', field_type)
+    return lambda value: value
+
+
+class CommandBuilders:
+    """
+    Holds a precompiled constructor for each cluster command,
+    so that invalid bodies are rejected before reaching the matter server.
+    """
+
+    def __init__(self, builders: Optional[Dict[type[ClusterCommand], Coercer]] = None):
+        self._builders = builders or {}
+
+    @classmethod
+    def precompile(cls, features: FeatureFilter = ALL_FEATURES) -> 'CommandBuilders':
+        """Compiles the constructors of all the exposed commands of all the clusters"""
+        builders: Dict[type[ClusterCommand], Coercer] = {}
+        clusters = getmembers(
+            Objects,
+            lambda attr: isclass(attr) and issubclass(attr, Cluster))
+        for cluster_name, cluster in clusters:
+            if not features.allows_cluster(cluster_name) or not hasattr(cluster, 'Commands'):
+                continue
+            commands = getmembers(
+                cluster.Commands,
+                lambda attr: isclass(attr) and issubclass(attr, ClusterCommand))
+            for command_name, command in commands:
+                if features.allows_command(cluster_name, command_name):
+                    builders[command] = _object_coercer(command)
+        logging.info('%d command constructors compiled', len(builders))
+        return cls(builders)
+
+    def build(self, command_class: type[ClusterCommand], parameters: Dict[str, Any]) -> ClusterCommand:
+        """Returns the command built from its json parameters.
+        Raises CommandArgumentError if the parameters are invalid."""
+        builder = self._builders.get(command_class, None)
+        if builder is None:
+            builder = _object_coercer(command_class)
+            self._builders[command_class] = builder
+        return builder(parameters)
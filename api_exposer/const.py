@@ -4,9 +4,54 @@ DEFAULT_PORT = 8080
 DEFAULT_SERVER_URL = 'ws://192.168.0.2:5580/ws'
 DEFAULT_LOG_LEVEL = 'info'
 DEFAULT_LOG_FILE = None
+DEFAULT_SHUTDOWN_TIMEOUT = 10.0
+DEFAULT_HISTORY_RETENTION = 24 * 60 * 60
+DEFAULT_HISTORY_CAPACITY = 4096
+DEFAULT_SNAPSHOT_FILE = None
+DEFAULT_SNAPSHOT_INTERVAL = 5 * 60
+DEFAULT_SUBSCRIPTIONS_FILE = './subscriptions.sqlite3'
+SUBSCRIPTION_RESTORE_BATCH_SIZE = 100
+DEFAULT_SUBSCRIPTION_PAGE_SIZE = 100
+DEFAULT_NODE_PAGE_SIZE = 100
 
 SWAGGER_TEMPLATE_FOLDER = 'api_exposer/templates/yml'
 SWAGGER_PATHS_TEMPLATE_FOLDER = 'api_exposer/templates/yml/paths'
 SWAGGER_HTML_FOLDER = 'api_exposer/templates/dynamic'
 STATIC_FOLDER = 'api_exposer/static'
+SWAGGER_STATIC_FOLDER = 'api_exposer/static/swagger'
+SWAGGER_ASSETS = [
+    'swagger-ui.css',
+    'index.css',
+    'favicon-32x32.png',
+    'favicon-16x16.png',
+    'swagger-ui-bundle.js',
+    'swagger-ui-standalone-preset.js',
+]
+STATIC_GZIP_LEVEL = 9
+STATIC_BROTLI_QUALITY = 11
+DYNAMIC_GZIP_LEVEL = 6
+DYNAMIC_BROTLI_QUALITY = 5
 FEATURES_JSON_FOLDER = './pdf_parser/out/features.json'
+NODE_ID_SHARD_SIZE = 1 << 32
+SHARD_START_TIMEOUT = 30.0
+SERVER_CONNECTION_TIMEOUT = 5.0
+SHARED_ENCODING_CACHE_SIZE = 64
+DOC_BODY_VARIANTS = 8
+COALESCED_COMMANDS = frozenset((
+    'MoveToLevel',
+    'MoveToLevelWithOnOff',
+    'MoveToHue',
+    'EnhancedMoveToHue',
+    'MoveToSaturation',
+    'MoveToHueAndSaturation',
+    'EnhancedMoveToHueAndSaturation',
+    'MoveToColor',
+    'MoveToColorTemperature',
+    'GoToLiftValue',
+    'GoToLiftPercentage',
+    'GoToTiltValue',
+    'GoToTiltPercentage',
+))
+NOTIFICATION_SOUND_FILE = './attention_tone_sm30-96953.mp3'
+NOTIFICATION_MIN_INTERVAL = 2.0
+NOTIFICATION_MAX_QUEUED = 3
@@ -0,0 +1,99 @@
+"""Contains the allow-list of the features exposed by the API Exposer"""
+
+import hashlib
+import json
+import logging
+from typing import Dict, FrozenSet, Optional, Tuple
+
+ATTRIBUTES = 'attributes'
+COMMANDS = 'commands'
+EVENTS = 'events'
+
+
+class FeatureFilter:
+    """
+    An allow-list index built from the features.json file.
+
+    The file maps the name of each supported cluster to either ``true``,
+    to expose the whole cluster, or to an object with optional
+    ``attributes``, ``commands`` and ``events`` lists of names.
+    A missing list exposes all the members of this kind.
+    A cluster missing from the file, or mapped to ``false``, is not exposed.
+    """
+
+    def __init__(
+            self,
+            clusters: Optional[FrozenSet[str]] = None,
+            members: Optional[Dict[Tuple[str, str], FrozenSet[str]]] = None):
+        # None means every cluster is allowed
+        self._clusters = clusters
+        # (cluster name, kind) -> allowed names, absent means all are allowed
+        self._members = members or {}
+
+    @classmethod
+    def load(cls, path: str) -> 'FeatureFilter':
+        """Builds the index from a features.json file.
+        Allows everything if the file can not be read."""
+        try:
+            with open(path, encoding='utf-8') as file:
+                features = json.load(file)
+        except (OSError, ValueError) as err:
+            logging.warning(
+                'features file %s not loaded, exposing everything : %s', path, err)
+            return cls()
+        if not isinstance(features, dict):
+            logging.warning(
+                'features file %s is not an object, exposing everything', path)
+            return cls()
+
+        clusters = set()
+        members: Dict[Tuple[str, str], FrozenSet[str]] = {}
+        for cluster_name, cluster_features in features.items():
+            if cluster_features is True:
+                clusters.add(cluster_name)
+                continue
+            if not isinstance(cluster_features, dict):
+                # false or anything else hides the cluster
+                continue
+            clusters.add(cluster_name)
+            for kind in (ATTRIBUTES, COMMANDS, EVENTS):
+                names = cluster_features.get(kind, None)
+                if names is not None:
+                    members[(cluster_name, kind)] = frozenset(names)
+
+        logging.info('%d clusters loaded from %s', len(clusters), path)
+        return cls(frozenset(clusters), members)
+
+    def allows_cluster(self, cluster_name: str) -> bool:
+        """Returns True if the cluster is exposed"""
+        return self._clusters is None or cluster_name in self._clusters
+
+    def _allows(self, cluster_name: str, kind: str, name: str) -> bool:
+        if not self.allows_cluster(cluster_name):
+            return False
+        names = self._members.get((cluster_name, kind), None)
+        return names is None or name in names
+
+    def allows_attribute(self, cluster_name: str, attribute_name: str) -> bool:
+        """Returns True if the attribute of the cluster is exposed"""
+        return self._allows(cluster_name, ATTRIBUTES, attribute_name)
+
+    def allows_command(self, cluster_name: str, command_name: str) -> bool:
+        """Returns True if the command of the cluster is exposed"""
+        return self._allows(cluster_name, COMMANDS, command_name)
+
+    def allows_event(self, cluster_name: str, event_name: str) -> bool:
+        """Returns True if the event of the cluster is exposed"""
+        return self._allows(cluster_name, EVENTS, event_name)
+
+    def fingerprint(self) -> str:
+        """Returns a digest of the allow-list, stable across runs"""
+        canonical = json.dumps([
+            None if self._clusters is None else sorted(self._clusters),
+            sorted(
+                [cluster_name, kind, sorted(names)]
+                for (cluster_name, kind), names in self._members.items())])
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+ALL_FEATURES = FeatureFilter()
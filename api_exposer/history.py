@@ -0,0 +1,160 @@
+"""Contains the opt-in history of attribute values"""
+
+import logging
+import math
+from array import array
+from bisect import bisect_left, bisect_right
+from time import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from api_exposer.sharded_client import ShardedClient
+
+
+HistoryKey = Tuple[int, int, str, str]
+Series = Tuple[List[float], List[float]]
+
+# the cluster_infos attribute types whose values can be recorded
+NUMERIC_TYPES = frozenset(('int', 'float'))
+
+
+def _to_number(value: Any) -> Optional[float]:
+    """Returns the value as a float or None if it is not numeric"""
+    if isinstance(value, (bool, int, float)):
+        number = float(value)
+        return number if math.isfinite(number) else None
+    return None
+
+
+class AttributeHistory:
+    """
+    A ring buffer of the numeric values of an attribute.
+    Timestamps and values are stored in two typed arrays of ``capacity`` samples,
+    samples older than ``retention`` seconds are dropped.
+    """
+
+    def __init__(self, capacity: int, retention: float):
+        self.capacity = capacity
+        self.retention = retention
+        self._timestamps = array('d', bytes(8 * capacity))
+        self._values = array('d', bytes(8 * capacity))
+        self._start = 0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _drop_expired(self, now: float):
+        cutoff = now - self.retention
+        while self._size > 0 and self._timestamps[self._start] < cutoff:
+            self._start = (self._start + 1) % self.capacity
+            self._size -= 1
+
+    def append(self, value: Any, timestamp: Optional[float] = None) -> bool:
+        """Adds a sample, returns False if the value is not numeric"""
+        number = _to_number(value)
+        if number is None:
+            return False
+        timestamp = time() if timestamp is None else timestamp
+        self._drop_expired(timestamp)
+
+        index = (self._start + self._size) % self.capacity
+        self._timestamps[index] = timestamp
+        self._values[index] = number
+        if self._size < self.capacity:
+            self._size += 1
+        else:
+            self._start = (self._start + 1) % self.capacity
+        return True
+
+    def _segments(self) -> List[Tuple[int, int]]:
+        """Returns the sorted ``[low, high)`` index ranges in chronological order"""
+        end = self._start + self._size
+        if end <= self.capacity:
+            return [(self._start, end)]
+        return [(self._start, self.capacity), (0, end - self.capacity)]
+
+    def query(self, start: float, end: float, step: Optional[float] = None) -> Series:
+        """Returns the samples between ``start`` and ``end``.
+        If ``step`` is given, the samples are averaged in buckets of ``step`` seconds."""
+        self._drop_expired(time())
+        timestamps: List[float] = []
+        values: List[float] = []
+        for low, high in self._segments():
+            first = bisect_left(self._timestamps, start, low, high)
+            last = bisect_right(self._timestamps, end, low, high)
+            timestamps.extend(self._timestamps[first:last])
+            values.extend(self._values[first:last])
+
+        if not step:
+            return timestamps, values
+        return self._downsample(timestamps, values, start, step)
+
+    @staticmethod
+    def _downsample(timestamps: List[float], values: List[float], start: float, step: float) -> Series:
+        buckets: Dict[int, Tuple[float, int]] = {}
+        for timestamp, value in zip(timestamps, values):
+            bucket = int((timestamp - start) // step)
+            total, count = buckets.get(bucket, (0.0, 0))
+            buckets[bucket] = (total + value, count + 1)
+        return (
+            [start + bucket * step for bucket in buckets],
+            [total / count for total, count in buckets.values()])
+
+
+class HistoryStore:
+    """
+    Records the history of the attributes chosen by the users,
+    fed by the attribute updates of the matter server.
+    """
+
+    def __init__(
+            self,
+            client: ShardedClient,
+            retentions: Dict[str, float],
+            default_retention: float,
+            capacity: int):
+        self._client = client
+        self._retentions = retentions
+        self._default_retention = default_retention
+        self._capacity = capacity
+        self._histories: Dict[HistoryKey, Tuple[AttributeHistory, Callable[[], None]]] = {}
+
+    def get(self, key: HistoryKey) -> Optional[AttributeHistory]:
+        """Returns the history of an attribute if it is recorded"""
+        entry = self._histories.get(key, None)
+        return None if entry is None else entry[0]
+
+    def record(
+            self,
+            key: HistoryKey,
+            cluster_id: int,
+            attribute_id: int) -> AttributeHistory:
+        """Starts recording an attribute, the retention is chosen by its cluster"""
+        history = self.get(key)
+        if history is not None:
+            return history
+
+        node_id, endpoint_id, cluster_name, _ = key
+        history = AttributeHistory(
+            self._capacity,
+            self._retentions.get(cluster_name, self._default_retention))
+        unsubscribe = self._client.subscribe_to_attribute(
+            node_id, endpoint_id, cluster_id, attribute_id, history.append)
+        self._histories[key] = (history, unsubscribe)
+        logging.debug('recording history of %s', key)
+        return history
+
+    def stop(self, key: HistoryKey) -> bool:
+        """Stops recording an attribute, returns False if it was not recorded"""
+        entry = self._histories.pop(key, None)
+        if entry is None:
+            return False
+        entry[1]()
+        logging.debug('stopped recording history of %s', key)
+        return True
+
+    def stop_all(self):
+        """Stops recording all the attributes, keeping their histories"""
+        for _, unsubscribe in self._histories.values():
+            unsubscribe()
+        logging.debug('stopped recording %d histories', len(self._histories))
@@ -2,8 +2,9 @@
 Contains the Nodes class for API-EXPOSER.
 """
 import logging
-from asyncio import Event, create_task, Task, iscoroutinefunction
-from typing import Callable, Dict, Optional, Any, Set
+from asyncio import CancelledError, Event, create_task, Task, iscoroutinefunction, wait, wait_for
+from dataclasses import replace
+from typing import Callable, Dict, List, Optional, Any, Set, Tuple
 
 from aiohttp import ClientSession
 from chip.clusters.ClusterObjects import ClusterCommand
@@ -11,6 +12,13 @@ from matter_server.common.models import EventType, MatterNodeEvent
 from matter_server.client.client import MatterClient
 from matter_server.client.models.node import MatterNode
 
+from api_exposer.const import NODE_ID_SHARD_SIZE, SERVER_CONNECTION_TIMEOUT
+from api_exposer.node_index import NodeIndex
+
+
+class ServerUnavailableError(ConnectionError):
+    """Raised when the Serveur of a node is not connected"""
+
 
 class MyClient:
     """ 
@@ -19,25 +27,92 @@ class MyClient:
     Matter Server is an implementation of a matter controller developed by Home Assistant.
     """
 
-    def __init__(self, url: str):
+    def __init__(self, url: str, node_id_offset: int = 0):
         self.nodes: Dict[int, MatterNode] = {}
+        self.index: NodeIndex = NodeIndex()
         self._url: str = url
+        # added to the node id of the events given to the subscribers
+        self._node_id_offset: int = node_id_offset
         self._client: Optional[MatterClient] = None
         self._wait_listening: Event = Event()
+        self._nodes_fetched: Event = Event()
         self._task: Optional[Task] = None
         self._tasks: Set[Task] = set()
+        # the event deliveries to the subscribers, drained on shutdown
+        self._deliveries: Set[Task] = set()
+        self._node_listeners: List[Callable[[int], None]] = []
+        # (node, endpoint, cluster, event) -> callbacks and whether they are coroutines
+        self._event_callbacks: Dict[Tuple[int, int, int, int], List[Tuple[Callable, bool]]] = {}
+        # (node, attribute path) -> callbacks, each path being subscribed once to the Serveur
+        self._attribute_callbacks: Dict[Tuple[int, str], List[Callable[[Any], None]]] = {}
+        self._attribute_unsubscribes: Dict[Tuple[int, str], Callable[[], None]] = {}
+
+    def _notify_node_changed(self, node_id: int):
+        for listener in self._node_listeners:
+            listener(node_id)
+
+    @staticmethod
+    def _is_exposable(node_id: int) -> bool:
+        """Returns False for the node ids overflowing into the namespace of the next shard"""
+        if 0 <= node_id < NODE_ID_SHARD_SIZE:
+            return True
+        logging.error('node %d ignored, its id is out of the shard namespace', node_id)
+        return False
 
     def _handle_node_added(self, node: MatterNode):
+        if not self._is_exposable(node.node_id):
+            return
         self.nodes[node.node_id] = node
+        self.index.add(node.node_id, node)
         logging.debug("node %d added %s", node.node_id, node)
+        self._notify_node_changed(node.node_id)
 
     def _handle_node_updated(self, node: MatterNode):
+        if not self._is_exposable(node.node_id):
+            return
         logging.debug("node %d updated %s", node.node_id, node)
         self.nodes[node.node_id] = node
+        self.index.add(node.node_id, node)
+        self._notify_node_changed(node.node_id)
 
     def _handle_node_removed(self, node_id: int):
+        if node_id not in self.nodes:
+            # an ignored node
+            return
         removed = self.nodes.pop(node_id)
+        self.index.remove(node_id)
         logging.debug("node %d added %s", node_id, removed)
+        self._notify_node_changed(node_id)
+
+    def _dispatch_event(self, data: MatterNodeEvent):
+        """Calls the callbacks subscribed to a node event"""
+        key = (data.node_id, data.endpoint_id, data.cluster_id, data.event_id)
+        callbacks = tuple(self._event_callbacks.get(key, ()))
+        if callbacks and self._node_id_offset:
+            # rewritten once, all the subscribers sharing the same event
+            data = replace(data, node_id=data.node_id + self._node_id_offset)
+        for callback, is_coroutine in callbacks:
+            if is_coroutine:
+                task = create_task(callback(data), name=f'event {key} to {callback}')
+                self._deliveries.add(task)
+                task.add_done_callback(self._deliveries.discard)
+            else:
+                callback(data)
+
+    def _dispatch_attribute(self, key: Tuple[int, str], value: Any):
+        """Calls the callbacks subscribed to an attribute"""
+        for callback in tuple(self._attribute_callbacks.get(key, ())):
+            callback(value)
+
+    def _attach_attribute(self, key: Tuple[int, str]):
+        """Subscribes to the updates of an attribute path on the connected Serveur.
+        The updates of an attribute only carry its value, hence one subscription per path."""
+        node_id, path = key
+        self._attribute_unsubscribes[key] = self._client.subscribe_events(
+            lambda _, value: self._dispatch_attribute(key, value),
+            EventType.ATTRIBUTE_UPDATED,
+            node_id,
+            path)
 
     def _handle_event(self, event: EventType, *args):
         """Passes all arguments after event to the specific event handler"""
@@ -48,6 +123,8 @@ class MyClient:
                 self._handle_node_updated(*args)
             case EventType.NODE_REMOVED:
                 self._handle_node_removed(*args)
+            case EventType.NODE_EVENT:
+                self._dispatch_event(*args)
             case _:
                 pass
 
@@ -56,25 +133,66 @@ class MyClient:
             async with MatterClient(self._url, session) as client:
                 self._client = client
                 self._client.subscribe_events(self._handle_event)
+                for key in self._attribute_callbacks:
+                    self._attach_attribute(key)
 
                 # start listening
                 await self._client.start_listening(self._wait_listening)
 
     async def _get_nodes(self):
+        """Gets the nodes from the Serveur and reconciles them
+        with the nodes loaded from a snapshot"""
         await self._wait_listening.wait()
-        self.nodes.update({
+        live_nodes = {
             node.node_id: node
             for node in self._client.get_nodes()
-        })
+            if self._is_exposable(node.node_id)
+        }
+        for node_id in self.nodes.keys() - live_nodes.keys():
+            self._handle_node_removed(node_id)
+        for node_id, node in live_nodes.items():
+            previous = self.nodes.get(node_id, None)
+            self.nodes[node_id] = node
+            self.index.add(node_id, node)
+            if previous is None or previous.node_data != node.node_data:
+                self._notify_node_changed(node_id)
+        self._nodes_fetched.set()
         logging.debug(self.nodes)
 
-    async def start(self):
-        """connect to Serveur and get matter nodes list"""
+    def load_nodes(self, nodes: Dict[int, MatterNode]):
+        """Serves nodes, usually from a snapshot, until the Serveur is reached"""
+        for node_id, node in nodes.items():
+            if self._is_exposable(node_id):
+                self.nodes[node_id] = node
+                self.index.add(node_id, node)
+
+    def subscribe_to_nodes(self, callback: Callable[[int], None]) -> Callable[[], None]:
+        """Calls back with the node id when a node is added, updated or removed.
+        Returns an unsubscribe handler."""
+        self._node_listeners.append(callback)
+        return lambda: self._node_listeners.remove(callback)
+
+    async def wait_connected(self):
+        """Waits until the client listens to the Serveur"""
+        await self._wait_listening.wait()
+
+    async def wait_nodes(self):
+        """Waits until the nodes are fetched from the Serveur"""
+        await self._nodes_fetched.wait()
+
+    async def start(self, wait: bool = True):
+        """connect to Serveur and get matter nodes list.
+        If ``wait`` is False, the nodes are fetched in the background."""
         if self._task is not None:
             logging.error("client already started")
             return
         self._task = create_task(self._run_client())
-        await self._get_nodes()
+        if wait:
+            await self._get_nodes()
+            return
+        task = create_task(self._get_nodes(), name='nodes reconciliation')
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
 
     async def wait_stop(self):
         """connect to Serveur and get matter nodes list"""
@@ -83,9 +201,55 @@ class MyClient:
             return
         await self._task
 
+    async def drain(self, timeout: float) -> List[str]:
+        """Waits for the pending event deliveries and cancels the ones
+        still running after ``timeout`` seconds. Returns the names of the cancelled ones."""
+        if not self._deliveries:
+            return []
+        _, pending = await wait(set(self._deliveries), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        return [task.get_name() for task in pending]
+
+    async def stop(self):
+        """Disconnects from the Serveur"""
+        if self._task is None:
+            logging.error("client not started")
+            return
+        if self._client is not None:
+            await self._client.disconnect()
+        self._task.cancel()
+        try:
+            await self._task
+        except CancelledError:
+            pass
+        except Exception as err:  # pylint: disable=broad-exception-caught
+            # the connection may have failed long before the shutdown
+            logging.warning('client of %s stopped with an error : %s', self._url, err)
+        for task in self._tasks:
+            task.cancel()
+        self._task = None
+        self._client = None
+        self._attribute_unsubscribes.clear()
+        self._wait_listening.clear()
+        self._nodes_fetched.clear()
+
+    async def _connected(self) -> MatterClient:
+        """Returns the client once it listens to the Serveur.
+        Fails fast when the connection is lost, the snapshot nodes being served without it."""
+        if self._task is None or self._task.done():
+            raise ServerUnavailableError(f'not connected to {self._url}')
+        try:
+            await wait_for(self._wait_listening.wait(), SERVER_CONNECTION_TIMEOUT)
+        except TimeoutError as err:
+            raise ServerUnavailableError(
+                f'{self._url} not reached after {SERVER_CONNECTION_TIMEOUT}s') from err
+        return self._client
+
     async def send_cluster_command(self, node_id: int, endpoint_id: int, command: ClusterCommand):
         """Sends a cluster command to an endpoint of a matter node"""
-        return await self._client.send_device_command(
+        client = await self._connected()
+        return await client.send_device_command(
             node_id,
             endpoint_id,
             command,
@@ -99,13 +263,34 @@ class MyClient:
             attribute_id: int) -> Any:
         """TODO"""
         path = f'{endpoint_id}/{cluster_id}/{attribute_id}'
-        value = await self._client.read_attribute(node_id, path)
+        client = await self._connected()
+        value = await client.read_attribute(node_id, path)
         logging.debug('READING CLUSTER ATTRIBUTE')
         logging.debug('node : %d', node_id)
         logging.debug('path : %s', path)
         logging.debug('value : %s', value)
         return value
 
+    async def read_cluster_attributes(
+            self,
+            node_id: int,
+            endpoint_id: int,
+            cluster_id: int) -> Dict[int, Any]:
+        """Reads all the attributes of a cluster with a wildcard path.
+        Returns their values by attribute id."""
+        path = f'{endpoint_id}/{cluster_id}/*'
+        client = await self._connected()
+        values = await client.read_attribute(node_id, path)
+        logging.debug('READING CLUSTER ATTRIBUTES')
+        logging.debug('node : %d', node_id)
+        logging.debug('path : %s', path)
+        if not isinstance(values, dict):
+            logging.warning('unexpected wildcard read of %s : %s', path, values)
+            return {}
+        return {
+            int(attribute_path.rsplit('/', 1)[-1]): value
+            for attribute_path, value in values.items()}
+
     async def write_cluster_attribute(
             self,
             node_id: int,
@@ -119,7 +304,8 @@ class MyClient:
         logging.debug('node : %d', node_id)
         logging.debug('path : %s', path)
         logging.debug('value : %s', value)
-        return await self._client.write_attribute(
+        client = await self._connected()
+        return await client.write_attribute(
             node_id,
             path,
             value)
@@ -131,47 +317,58 @@ class MyClient:
             cluster_id: int,
             event_id: int,
             callback: Callable[[MatterNodeEvent], None]) -> Callable[[], None]:
-        """Subscribes to an event. Returns an unsubscribe handler. The callback can be a coroutine."""
+        """Subscribes to an event. Returns an unsubscribe handler. The callback can be a coroutine.
+        The events are dispatched from a table, so subscribing is cheap
+        and does not need the client to be connected.
+        The events given to the callback carry the node id shifted by ``node_id_offset``."""
         path = f'{endpoint_id}/{cluster_id}/{event_id}'
-        logging.debug('READING CLUSTER ATTRIBUTE')
+        logging.debug('SUBSCRIBING TO CLUSTER EVENT')
         logging.debug('node : %d', node_id)
         logging.debug('path : %s', path)
         logging.debug('callback : %s', callback)
 
-        if iscoroutinefunction(callback):
-            def handle(_, data: MatterNodeEvent):
-                if data.endpoint_id != endpoint_id:
-                    return
-                if data.cluster_id != cluster_id:
-                    return
-                if data.event_id != event_id:
-                    return
-                task = create_task(callback(data))
-                self._tasks.add(task)
-                task.add_done_callback(self._tasks.discard)
-        else:
-            def handle(_, data: MatterNodeEvent):
-                if data.endpoint_id != endpoint_id:
-                    return
-                if data.cluster_id != cluster_id:
-                    return
-                if data.event_id != event_id:
-                    return
-                callback(data)
+        key = (node_id, endpoint_id, cluster_id, event_id)
+        entry = (callback, iscoroutinefunction(callback))
+        self._event_callbacks.setdefault(key, []).append(entry)
+
+        def unsubscribe():
+            callbacks = self._event_callbacks.get(key, [])
+            if entry in callbacks:
+                callbacks.remove(entry)
+            if not callbacks:
+                self._event_callbacks.pop(key, None)
+        return unsubscribe
+
+    def subscribe_to_attribute(
+            self,
+            node_id: int,
+            endpoint_id: int,
+            cluster_id: int,
+            attribute_id: int,
+            callback: Callable[[Any], None]) -> Callable[[], None]:
+        """Subscribes to the updates of an attribute. Returns an unsubscribe handler.
+        The callback receives the new value of the attribute.
+        The updates are dispatched from a table, so the client does not need to be connected."""
+        path = f'{endpoint_id}/{cluster_id}/{attribute_id}'
+        logging.debug('SUBSCRIBING TO CLUSTER ATTRIBUTE')
+        logging.debug('node : %d', node_id)
+        logging.debug('path : %s', path)
+        logging.debug('callback : %s', callback)
+
+        key = (node_id, path)
+        callbacks = self._attribute_callbacks.setdefault(key, [])
+        callbacks.append(callback)
+        # before the connection, the paths are subscribed once connected
+        if len(callbacks) == 1 and self._client is not None:
+            self._attach_attribute(key)
 
-        return self._client.subscribe_events(handle, EventType.NODE_EVENT, node_id)
-
-    # def subscribe_to_attribute(
-    #         self,
-    #         node_id: int,
-    #         endpoint_id: int,
-    #         cluster_id: int,
-    #         attribute_id: int,
-    #         callback: Callable[[EventType, Any], None]) -> Callable[[], None]:
-    #     """Subscribes to an attribute. Returns an unsubscribe handler. The callback can be a coroutine."""
-    #     path = f'{endpoint_id}/{cluster_id}/{attribute_id}'
-    #     logging.debug('READING CLUSTER ATTRIBUTE')
-    #     logging.debug('node : %d', node_id)
-    #     logging.debug('path : %s', path)
-    #     logging.debug('callback : %s', callback)
-    #     return self._client.subscribe_events(callback, EventType.ATTRIBUTE_UPDATED, node_id, path)
+        def unsubscribe():
+            callbacks = self._attribute_callbacks.get(key, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+            if not callbacks:
+                self._attribute_callbacks.pop(key, None)
+                detach = self._attribute_unsubscribes.pop(key, None)
+                if detach is not None:
+                    detach()
+        return unsubscribe
@@ -0,0 +1,129 @@
+"""Contains the secondary indexes of the nodes used by the inventory"""
+
+from bisect import bisect_right, insort
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, List, Optional, Set
+
+from matter_server.client.models.node import MatterNode
+
+
+@dataclass
+class NodeFilters:
+    """The filters of an inventory query, None means no filter"""
+    device_type: Optional[int] = None
+    cluster_id: Optional[int] = None
+    vendor_id: Optional[int] = None
+    available: Optional[bool] = None
+
+
+@dataclass
+class _NodeKeys:
+    """The index keys of a node, kept to remove the node from the indexes"""
+    device_types: FrozenSet[int] = field(default_factory=frozenset)
+    cluster_ids: FrozenSet[int] = field(default_factory=frozenset)
+    vendor_id: Optional[int] = None
+    available: bool = False
+
+
+def _vendor_id(node: MatterNode) -> Optional[int]:
+    return getattr(node.device_info, 'vendorID', None)
+
+
+def _node_keys(node: MatterNode) -> _NodeKeys:
+    return _NodeKeys(
+        frozenset(
+            device_type.device_type
+            for endpoint in node.endpoints.values()
+            for device_type in endpoint.device_types),
+        frozenset(
+            cluster_id
+            for endpoint in node.endpoints.values()
+            for cluster_id in endpoint.clusters),
+        _vendor_id(node),
+        node.available)
+
+
+def node_summary(node_id: int, node: MatterNode) -> Dict[str, Any]:
+    """Returns the inventory entry of a node"""
+    keys = _node_keys(node)
+    return {
+        'node_id': node_id,
+        'available': keys.available,
+        'vendor_id': keys.vendor_id,
+        'product_name': getattr(node.device_info, 'productName', None),
+        'device_types': sorted(keys.device_types),
+        'endpoints': sorted(node.endpoints.keys()),
+    }
+
+
+class NodeIndex:
+    """
+    Secondary indexes of the nodes by device type, cluster id, vendor id and availability.
+    They are updated incrementally when a node is added, updated or removed,
+    so that the queries intersect sets instead of scanning all the nodes.
+    """
+
+    def __init__(self):
+        self._keys: Dict[int, _NodeKeys] = {}
+        self._node_ids: List[int] = []
+        self._by_device_type: Dict[int, Set[int]] = {}
+        self._by_cluster: Dict[int, Set[int]] = {}
+        self._by_vendor: Dict[Optional[int], Set[int]] = {}
+        self._by_availability: Dict[bool, Set[int]] = {}
+
+    @staticmethod
+    def _discard(index: Dict[Any, Set[int]], key: Any, node_id: int):
+        node_ids = index.get(key, None)
+        if node_ids is None:
+            return
+        node_ids.discard(node_id)
+        if not node_ids:
+            del index[key]
+
+    def add(self, node_id: int, node: MatterNode):
+        """Indexes a node, replacing its previous keys"""
+        if node_id in self._keys:
+            self.remove(node_id)
+        keys = _node_keys(node)
+        self._keys[node_id] = keys
+        insort(self._node_ids, node_id)
+        for device_type in keys.device_types:
+            self._by_device_type.setdefault(device_type, set()).add(node_id)
+        for cluster_id in keys.cluster_ids:
+            self._by_cluster.setdefault(cluster_id, set()).add(node_id)
+        self._by_vendor.setdefault(keys.vendor_id, set()).add(node_id)
+        self._by_availability.setdefault(keys.available, set()).add(node_id)
+
+    def remove(self, node_id: int):
+        """Removes a node from the indexes"""
+        keys = self._keys.pop(node_id, None)
+        if keys is None:
+            return
+        self._node_ids.remove(node_id)
+        for device_type in keys.device_types:
+            self._discard(self._by_device_type, device_type, node_id)
+        for cluster_id in keys.cluster_ids:
+            self._discard(self._by_cluster, cluster_id, node_id)
+        self._discard(self._by_vendor, keys.vendor_id, node_id)
+        self._discard(self._by_availability, keys.available, node_id)
+
+    def page(self, cursor: Optional[int], limit: int, filters: NodeFilters) -> List[int]:
+        """Returns at most ``limit`` sorted node ids greater than ``cursor`` matching the filters"""
+        candidates: List[Set[int]] = []
+        if filters.device_type is not None:
+            candidates.append(self._by_device_type.get(filters.device_type, set()))
+        if filters.cluster_id is not None:
+            candidates.append(self._by_cluster.get(filters.cluster_id, set()))
+        if filters.vendor_id is not None:
+            candidates.append(self._by_vendor.get(filters.vendor_id, set()))
+        if filters.available is not None:
+            candidates.append(self._by_availability.get(filters.available, set()))
+
+        if candidates:
+            candidates.sort(key=len)
+            node_ids = sorted(set.intersection(*candidates))
+        else:
+            node_ids = self._node_ids
+
+        start = 0 if cursor is None else bisect_right(node_ids, cursor)
+        return node_ids[start:start + limit]
@@ -0,0 +1,93 @@
+"""Contains the local notification actions of the API Exposer"""
+
+import logging
+import os
+import tempfile
+from asyncio import Queue, QueueFull, Task, create_task, get_running_loop, sleep, to_thread
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+from typing import Optional
+
+from playsound import playsound
+
+
+class SoundNotifier:
+    """
+    Plays a notification sound on a dedicated thread, one at a time.
+    The triggers arriving while a sound is playing are queued, up to ``max_queued``,
+    and two sounds are played at least ``min_interval`` seconds apart.
+    """
+
+    def __init__(self, sound_file: str, min_interval: float, max_queued: int):
+        self._min_interval = min_interval
+        self._queue: Queue = Queue(maxsize=max_queued)
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='notifier')
+        self._task: Optional[Task] = None
+        self._last_played = 0.0
+
+        # playsound only playing files, the sound is copied once
+        # in a directory living as long as the notifier
+        self._directory: Optional[tempfile.TemporaryDirectory] = None
+        self._path: Optional[str] = None
+        try:
+            with open(sound_file, 'rb') as file:
+                sound = file.read()
+        except OSError as err:
+            # the API is served without the notifications
+            logging.error('notification sound %s not loaded : %s', sound_file, err)
+            return
+        self._directory = tempfile.TemporaryDirectory()
+        self._path = os.path.join(
+            self._directory.name, os.path.basename(sound_file))
+        with open(self._path, 'wb') as file:
+            file.write(sound)
+
+    @property
+    def available(self) -> bool:
+        """Returns False if the sound could not be loaded"""
+        return self._path is not None
+
+    def start(self):
+        """Starts playing the triggered sounds"""
+        if self._task is not None:
+            logging.error('notifier already started')
+            return
+        self._task = create_task(self._run())
+
+    def trigger(self) -> bool:
+        """Queues a sound, returns False if too many sounds are already queued
+        or if there is no sound"""
+        if not self.available:
+            return False
+        try:
+            self._queue.put_nowait(None)
+        except QueueFull:
+            logging.info('notification dropped, %d already queued',
+                         self._queue.qsize())
+            return False
+        return True
+
+    async def _run(self):
+        loop = get_running_loop()
+        while True:
+            await self._queue.get()
+            wait = self._last_played + self._min_interval - monotonic()
+            if wait > 0:
+                await sleep(wait)
+            self._last_played = monotonic()
+            logging.info('Playing sound %s', self._path)
+            try:
+                await loop.run_in_executor(self._executor, playsound, self._path)
+            except Exception as err:  # pylint: disable=broad-exception-caught
+                logging.warning('sound %s not played : %s', self._path, err)
+
+    async def stop(self):
+        """Stops playing sounds and removes the sound file
+        once the sound being played is finished"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await to_thread(self._executor.shutdown, wait=True, cancel_futures=True)
+        if self._directory is not None:
+            self._directory.cleanup()
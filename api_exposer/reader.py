@@ -0,0 +1,110 @@
+"""Reads all the attributes of a cluster or of an endpoint at once"""
+
+import logging
+from asyncio import gather
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set
+
+from chip.clusters.CHIPClusters import ChipClusters
+from chip.clusters.ClusterObjects import Cluster
+from matter_server.client.models.node import MatterNode, MatterEndpoint
+
+from api_exposer.features import FeatureFilter
+from api_exposer.sharded_client import ShardedClient
+
+
+@dataclass
+class Reader:
+    """
+    Reads the attributes from the local attribute model of the nodes,
+    kept up to date by the matter server events.
+    Only the attributes of the AttributeList of the cluster are returned.
+    The clusters whose AttributeList is not in the model are read with a single wildcard read.
+    """
+    client: ShardedClient
+    cluster_infos: ChipClusters
+    attribute_list_id: int
+    features: FeatureFilter = field(default_factory=FeatureFilter)
+
+    def _attribute_names(self, cluster: Cluster) -> Dict[int, str]:
+        """Returns the exposed attribute names of a cluster by attribute id"""
+        cluster_info = self.cluster_infos.GetClusterInfoById(cluster.id)
+        if cluster_info is None:
+            return {}
+        cluster_name = cluster.__class__.__name__
+        return {
+            attribute_id: attribute['attributeName']
+            for attribute_id, attribute in cluster_info.get('attributes', {}).items()
+            if 'attributeName' in attribute
+            and self.features.allows_attribute(cluster_name, attribute['attributeName'])}
+
+    async def read_cluster(
+            self,
+            node_id: int,
+            node: MatterNode,
+            endpoint_id: int,
+            cluster: Cluster,
+            names: Optional[Set[str]] = None) -> Dict[str, Any]:
+        """Returns the values of the attributes of a cluster by name,
+        only the ``names`` ones if given"""
+        attribute_names = {
+            attribute_id: name
+            for attribute_id, name in self._attribute_names(cluster).items()
+            if names is None or name in names}
+        local_values = node.node_data.attributes
+        attribute_list = local_values.get(
+            f'{endpoint_id}/{cluster.id}/{self.attribute_list_id}', None)
+
+        if attribute_list is not None:
+            # the node implements only these attributes, all of them in the model
+            values: Dict[str, Any] = {}
+            for attribute_id in attribute_list:
+                path = f'{endpoint_id}/{cluster.id}/{attribute_id}'
+                if attribute_id in attribute_names and path in local_values:
+                    values[attribute_names[attribute_id]] = local_values[path]
+            return values
+
+        logging.debug(
+            'AttributeList of %s not in the local model', cluster.__class__.__name__)
+        read_values = await self.client.read_cluster_attributes(
+            node_id, endpoint_id, cluster.id)
+        return {
+            name: read_values[attribute_id]
+            for attribute_id, name in attribute_names.items()
+            if attribute_id in read_values}
+
+    async def read_endpoint(
+            self,
+            node_id: int,
+            node: MatterNode,
+            endpoint: MatterEndpoint,
+            fields: Optional[Set[str]] = None) -> Dict[str, Dict[str, Any]]:
+        """Returns the attribute values of all the clusters of an endpoint by cluster name.
+        ``fields`` selects whole clusters with ``Cluster`` and single attributes
+        with ``Cluster.attribute``."""
+        clusters: List[Cluster] = []
+        names: List[Optional[Set[str]]] = []
+        for cluster in endpoint.clusters.values():
+            cluster_name = cluster.__class__.__name__
+            if not hasattr(cluster, 'id') or not self.features.allows_cluster(cluster_name):
+                continue
+            if fields is None or cluster_name in fields:
+                cluster_fields = None
+            else:
+                prefix = f'{cluster_name}.'
+                cluster_fields = {
+                    selected[len(prefix):]
+                    for selected in fields
+                    if selected.startswith(prefix)}
+                if not cluster_fields:
+                    continue
+            clusters.append(cluster)
+            names.append(cluster_fields)
+
+        values = await gather(*(
+            self.read_cluster(
+                node_id, node, endpoint.endpoint_id, cluster, cluster_fields)
+            for cluster, cluster_fields in zip(clusters, names)))
+        return {
+            cluster.__class__.__name__: cluster_values
+            for cluster, cluster_values in zip(clusters, values)}
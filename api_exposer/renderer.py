@@ -1,10 +1,10 @@
 """Convert matter objects into yaml"""
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from inspect import getmembers, isclass
 import logging
 from asyncio import gather
-from typing import Any, Dict, Iterable, Optional, Type
+from typing import Any, Dict, Hashable, Iterable, List, Mapping, Optional, Tuple, Type
 from jinja2 import Environment, FileSystemLoader, select_autoescape
 from matter_server.client.models.node import MatterNode, MatterEndpoint
 from chip.clusters.ClusterObjects import Cluster, ClusterObjectFieldDescriptor
@@ -12,8 +12,9 @@ from chip.clusters.CHIPClusters import ChipClusters
 from chip.clusters.ClusterObjects import ClusterEvent
 
 from api_exposer.utils import filter_not_none, flat_map
-from api_exposer.const import SWAGGER_PATHS_TEMPLATE_FOLDER
-from api_exposer.my_client import MyClient
+from api_exposer.features import FeatureFilter
+from api_exposer.const import SWAGGER_PATHS_TEMPLATE_FOLDER, DOC_BODY_VARIANTS
+from api_exposer.sharded_client import ShardedClient
 
 
 env = Environment(
@@ -21,14 +22,25 @@ env = Environment(
     autoescape=select_autoescape()
 )
 
+RenderJob = Tuple[str, Dict[str, Any]]
+
+
+def render_templates(jobs: List[RenderJob]) -> List[str]:
+    """Renders a batch of ``(template_name, context)`` jobs"""
+    return [env.get_template(name).render(**context) for name, context in jobs]
+
 
 @dataclass
 class Renderer:
     """TODO"""
-    client: MyClient
+    client: ShardedClient
     cluster_infos: ChipClusters
     attribute_list_id: int
     accepted_command_list_id: int
+    features: FeatureFilter = field(default_factory=FeatureFilter)
+    _docs: Dict[int, str] = field(default_factory=dict, init=False)
+    # node id -> encoded documentation bodies, by variant of the final document
+    _bodies: Dict[int, Dict[Hashable, bytes]] = field(default_factory=dict, init=False)
 
     # def _convert_type(self, class_type: type) -> str:
     #     match class_type:
@@ -52,13 +64,9 @@ class Renderer:
             endpoint_id: int,
             endpoint_name: str,
             cluster: Cluster,
-            attribute: ClusterObjectFieldDescriptor) -> Optional[str]:
-        """Renders an attribute path into its OpenAPI yaml format"""
-        jinja_template = env.get_template("attribute.yml.j2")
-        if jinja_template is None:
-            return None
-
-        return jinja_template.render(
+            attribute: ClusterObjectFieldDescriptor) -> Optional[RenderJob]:
+        """Prepares the rendering of an attribute path into its OpenAPI yaml format"""
+        return 'attribute.yml.j2', dict(
             node_id=node_id,
             endpoint_id=endpoint_id,
             endpoint_name_list=endpoint_name,
@@ -75,12 +83,8 @@ class Renderer:
             endpoint_id: int,
             endpoint_name: str,
             cluster: Cluster,
-            event: Type[ClusterEvent]) -> Optional[str]:
-        jinja_template = env.get_template("event.yml.j2")
-        if jinja_template is None:
-            return None
-
-        return jinja_template.render(
+            event: Type[ClusterEvent]) -> Optional[RenderJob]:
+        return 'event.yml.j2', dict(
             node_id=node_id,
             endpoint_id=endpoint_id,
             endpoint_name_list=endpoint_name,
@@ -93,13 +97,9 @@ class Renderer:
             endpoint_id: int,
             endpoint_name: str,
             cluster: Cluster,
-            command: Dict[str, Any]) -> Optional[str]:
-        """Renders a command into its OpenAPI yaml format"""
-        jinja_template = env.get_template("command.yml.j2")
-        if jinja_template is None:
-            return None
-
-        return jinja_template.render(
+            command: Dict[str, Any]) -> Optional[RenderJob]:
+        """Prepares the rendering of a command into its OpenAPI yaml format"""
+        return 'command.yml.j2', dict(
             node_id=node_id,
             endpoint_id=endpoint_id,
             endpoint_name_list=endpoint_name,
@@ -115,7 +115,7 @@ class Renderer:
             node_id: int,
             endpoint_id: int,
             endpoint_name: str,
-            cluster: Cluster) -> Iterable[str]:
+            cluster: Cluster) -> Iterable[RenderJob]:
         """Renders the readable attributes of a cluster into its OpenAPI yaml format"""
         attribute_ids = await self.client.read_cluster_attribute(
             node_id,
@@ -137,7 +137,10 @@ class Renderer:
                 cluster,
                 attributes[attribute_id])
             for attribute_id in attribute_ids
-            if attribute_id in attributes)
+            if attribute_id in attributes
+            and self.features.allows_attribute(
+                cluster.__class__.__name__,
+                attributes[attribute_id].get('attributeName', None)))
 
         return filter_not_none(result)
 
@@ -146,7 +149,7 @@ class Renderer:
             node_id: int,
             endpoint_id: int,
             endpoint_name: str,
-            cluster: Cluster) -> Iterable[str]:
+            cluster: Cluster) -> Iterable[RenderJob]:
         events = self._get_events(cluster)
         result = (
             self._render_event(
@@ -155,7 +158,8 @@ class Renderer:
                 endpoint_name,
                 cluster,
                 event)
-            for event in events)
+            for event in events
+            if self.features.allows_event(cluster.__class__.__name__, event.__name__))
         return filter_not_none(result)
 
     async def _render_commands(
@@ -163,7 +167,7 @@ class Renderer:
             node_id: int,
             endpoint_id: int,
             endpoint_name: str,
-            cluster: Cluster) -> Iterable[str]:
+            cluster: Cluster) -> Iterable[RenderJob]:
         """Renders the commands of a cluster into its OpenAPI yaml format"""
         command_ids = await self.client.read_cluster_attribute(
             node_id,
@@ -185,7 +189,10 @@ class Renderer:
                 cluster,
                 commands[command_id])
             for command_id in command_ids
-            if command_id in commands)
+            if command_id in commands
+            and self.features.allows_command(
+                cluster.__class__.__name__,
+                commands[command_id].get('commandName', None)))
 
         return filter_not_none(result)
 
@@ -194,13 +201,18 @@ class Renderer:
             node_id: int,
             endpoint_id: int,
             endpoint_name: str,
-            cluster: Cluster) -> Iterable[str]:
+            cluster: Cluster) -> Iterable[RenderJob]:
         """Renders a cluster into its OpenAPI yaml format"""
         if not hasattr(cluster, 'id') or self.cluster_infos.GetClusterInfoById(cluster.id) is None:
             logging.info(
                 'The cluster %s has no id',
                 cluster.__class__.__name__)
             return []
+        if not self.features.allows_cluster(cluster.__class__.__name__):
+            logging.debug(
+                'The cluster %s is filtered out',
+                cluster.__class__.__name__)
+            return []
 
         attributes = self._render_attributes(
             node_id,
@@ -218,8 +230,14 @@ class Renderer:
             endpoint_name,
             cluster)
 
+        cluster_path = ('cluster.yml.j2', dict(
+            node_id=node_id,
+            endpoint_id=endpoint_id,
+            endpoint_name_list=endpoint_name,
+            cluster_name=cluster.__class__.__name__))
+
         logging.debug('await cluster')
-        result = flat_map(await gather(attributes, commands, events))
+        result = flat_map([[cluster_path], *await gather(attributes, commands, events)])
         logging.debug('finished waiting cluster')
         return result
 
@@ -228,11 +246,11 @@ class Renderer:
             device_type.__name__
             for device_type in endpoint.device_types)
 
-    async def _render_endpoint(self, endpoint: MatterEndpoint) -> Iterable[str]:
+    async def _render_endpoint(self, node_id: int, endpoint: MatterEndpoint) -> Iterable[RenderJob]:
         """Renders an endpoint into its OpenAPI yaml format"""
         clusters = (
             self._render_cluster(
-                node_id=endpoint.node.node_id,
+                node_id=node_id,
                 endpoint_id=endpoint.endpoint_id,
                 endpoint_name=self._get_endpoint_names(endpoint),
                 cluster=cluster)
@@ -243,21 +261,55 @@ class Renderer:
         logging.debug('finished waiting endpoint')
         return flat_map(clusters)
 
-    async def render_node(self, node: MatterNode) -> Optional[str]:
-        """Renders a node into its OpenAPI yaml format"""
+    def invalidate(self, node_id: int):
+        """Forgets the rendered documentation of a node and its encoded bodies"""
+        self._docs.pop(node_id, None)
+        self._bodies.pop(node_id, None)
+
+    def get_body(self, node_id: int, variant: Hashable) -> Optional[bytes]:
+        """Returns an encoded body of the documentation of a node if it is kept"""
+        return self._bodies.get(node_id, {}).get(variant, None)
+
+    def keep_body(self, node_id: int, variant: Hashable, body: bytes):
+        """Keeps an encoded body of the documentation of a node until the node changes.
+        The variants come from the requests, so only the last DOC_BODY_VARIANTS are kept."""
+        if node_id not in self._docs:
+            return
+        bodies = self._bodies.setdefault(node_id, {})
+        if variant not in bodies and len(bodies) >= DOC_BODY_VARIANTS:
+            del bodies[next(iter(bodies))]
+        bodies[variant] = body
+
+    def export_docs(self) -> Dict[int, str]:
+        """Returns the rendered documentations by node id"""
+        return dict(self._docs)
+
+    def import_docs(self, docs: Mapping[int, str]):
+        """Serves already rendered documentations, usually from a snapshot"""
+        self._docs.update(docs)
+
+    async def render_node(self, node_id: int, node: MatterNode) -> Optional[str]:
+        """Renders a node into its OpenAPI yaml format.
+        ``node_id`` is the namespaced id under which the node is exposed.
+        The result is kept until the node changes."""
+        cached = self._docs.get(node_id, None)
+        if cached is not None:
+            return cached
+
         endpoints = (
-            self._render_endpoint(endpoint)
+            self._render_endpoint(node_id, endpoint)
             for endpoint in node.endpoints.values())
 
         logging.debug('await node')
         endpoints = await gather(*endpoints)
         logging.debug('finished waiting node')
-        endpoints = flat_map(endpoints)
-        endpoints = filter_not_none(endpoints)
+        jobs = list(filter_not_none(flat_map(endpoints)))
+        paths = render_templates(jobs)
 
-        result = '\n\n'.join(endpoints)
+        result = '\n\n'.join(paths)
         if result == '':
             return None
+        self._docs[node_id] = result
         return result
 
     def _get_events(
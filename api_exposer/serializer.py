@@ -0,0 +1,100 @@
+"""Serializes matter values and events into json"""
+
+import json
+from base64 import b64encode
+from collections import OrderedDict
+from dataclasses import fields, is_dataclass
+from datetime import date, time
+from enum import Enum
+from typing import Any, Callable, Dict, Tuple
+
+from chip.clusters.Types import Nullable
+
+from api_exposer.const import SHARED_ENCODING_CACHE_SIZE
+
+
+Encoder = Callable[[Any], Any]
+
+_encoders: Dict[type, Encoder] = {}
+_shared: OrderedDict[int, Tuple[Any, bytes]] = OrderedDict()
+
+
+def _identity(value: Any) -> Any:
+    return value
+
+
+def _encode_bytes(value: bytes) -> str:
+    return b64encode(value).decode('ascii')
+
+
+def _encode_list(value: Any) -> list:
+    return [to_jsonable(item) for item in value]
+
+
+def _encode_dict(value: dict) -> dict:
+    return {str(key): to_jsonable(item) for key, item in value.items()}
+
+
+def _dataclass_encoder(value_type: type) -> Encoder:
+    names = tuple(field.name for field in fields(value_type))
+
+    def encode(value: Any) -> dict:
+        return {name: to_jsonable(getattr(value, name)) for name in names}
+    return encode
+
+
+def _build_encoder(value_type: type) -> Encoder:
+    if issubclass(value_type, Enum):
+        return lambda value: to_jsonable(value.value)
+    if issubclass(value_type, (str, int, float, type(None))):
+        return _identity
+    if issubclass(value_type, Nullable):
+        return lambda value: None
+    if issubclass(value_type, (bytes, bytearray)):
+        return _encode_bytes
+    if issubclass(value_type, (date, time)):
+        return lambda value: value.isoformat()
+    if is_dataclass(value_type):
+        return _dataclass_encoder(value_type)
+    if issubclass(value_type, dict):
+        return _encode_dict
+    if issubclass(value_type, (list, tuple, set, frozenset)):
+        return _encode_list
+    return str
+
+
+def to_jsonable(value: Any) -> Any:
+    """Converts a value into json compatible types.
+    The encoder of each type is built once and cached.
+    Enums are converted into their value, bytes into base64
+    and CHIP null values into None."""
+    value_type = type(value)
+    encoder = _encoders.get(value_type, None)
+    if encoder is None:
+        encoder = _build_encoder(value_type)
+        _encoders[value_type] = encoder
+    return encoder(value)
+
+
+def encode(value: Any) -> bytes:
+    """Returns the compact json encoding of a value"""
+    return json.dumps(
+        to_jsonable(value),
+        ensure_ascii=False,
+        separators=(',', ':')).encode('utf-8')
+
+
+def encode_shared(value: Any) -> bytes:
+    """Returns the json encoding of a value, encoding it only once
+    for all the callers receiving the same object, like the subscribers of an event"""
+    key = id(value)
+    cached = _shared.get(key, None)
+    # the object is kept in the cache so its id can not be reused
+    if cached is not None and cached[0] is value:
+        return cached[1]
+
+    content = encode(value)
+    _shared[key] = (value, content)
+    if len(_shared) > SHARED_ENCODING_CACHE_SIZE:
+        _shared.popitem(last=False)
+    return content
@@ -0,0 +1,210 @@
+"""
+Contains the ShardedClient class for API-EXPOSER.
+"""
+import logging
+from asyncio import create_task, gather, wait
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Optional, Tuple
+
+from chip.clusters.ClusterObjects import ClusterCommand
+from matter_server.common.models import MatterNodeEvent
+from matter_server.client.models.node import MatterNode
+
+from api_exposer.const import NODE_ID_SHARD_SIZE, SHARD_START_TIMEOUT
+from api_exposer.my_client import MyClient
+from api_exposer.node_index import NodeFilters
+
+
+class ShardedNodes(Mapping[int, MatterNode]):
+    """
+    A read-only view over the nodes of all the shards, keyed by namespaced node id.
+    The namespaced id of a node is ``shard_index * NODE_ID_SHARD_SIZE + node_id``,
+    so the nodes of the first shard keep their own id.
+    """
+
+    def __init__(self, shards: List[MyClient]):
+        self._shards = shards
+
+    def __getitem__(self, node_id: int) -> MatterNode:
+        shard_index, local_id = divmod(node_id, NODE_ID_SHARD_SIZE)
+        if not 0 <= shard_index < len(self._shards):
+            raise KeyError(node_id)
+        return self._shards[shard_index].nodes[local_id]
+
+    def __iter__(self) -> Iterator[int]:
+        for shard_index, shard in enumerate(self._shards):
+            for local_id in shard.nodes:
+                yield shard_index * NODE_ID_SHARD_SIZE + local_id
+
+    def __len__(self) -> int:
+        return sum(len(shard.nodes) for shard in self._shards)
+
+
+class ShardedClient:
+    """
+    Fronts several matter servers, one MyClient per fabric.
+    Each shard keeps its own websocket so that the traffic of a fabric
+    is never blocked behind the traffic of another one.
+    Requests are routed to the right shard using the namespaced node id.
+    """
+
+    def __init__(self, urls: List[str]):
+        self.shards: List[MyClient] = [
+            MyClient(url, shard_index * NODE_ID_SHARD_SIZE)
+            for shard_index, url in enumerate(urls)]
+        self.nodes: ShardedNodes = ShardedNodes(self.shards)
+
+    def _route(self, node_id: int) -> Tuple[MyClient, int]:
+        """Returns the shard owning the node and the node id inside this shard"""
+        shard_index, local_id = divmod(node_id, NODE_ID_SHARD_SIZE)
+        if not 0 <= shard_index < len(self.shards):
+            raise KeyError(node_id)
+        return self.shards[shard_index], local_id
+
+    def load_nodes(self, nodes: Dict[int, MatterNode]):
+        """Serves nodes keyed by namespaced id until the Serveurs are reached.
+        The nodes of a missing shard are ignored."""
+        shard_nodes: Dict[int, Dict[int, MatterNode]] = {}
+        for node_id, node in nodes.items():
+            shard_index, local_id = divmod(node_id, NODE_ID_SHARD_SIZE)
+            if shard_index < len(self.shards):
+                shard_nodes.setdefault(shard_index, {})[local_id] = node
+        for shard_index, local_nodes in shard_nodes.items():
+            self.shards[shard_index].load_nodes(local_nodes)
+
+    def subscribe_to_nodes(self, callback: Callable[[int], None]) -> Callable[[], None]:
+        """Calls back with the namespaced node id when a node is added, updated or removed.
+        Returns an unsubscribe handler."""
+        def shard_callback(shard_index: int) -> Callable[[int], None]:
+            return lambda local_id: callback(shard_index * NODE_ID_SHARD_SIZE + local_id)
+
+        unsubscribes = [
+            shard.subscribe_to_nodes(shard_callback(shard_index))
+            for shard_index, shard in enumerate(self.shards)]
+
+        def unsubscribe():
+            for shard_unsubscribe in unsubscribes:
+                shard_unsubscribe()
+        return unsubscribe
+
+    def page_nodes(
+            self,
+            cursor: Optional[int],
+            limit: int,
+            filters: NodeFilters) -> Tuple[List[int], Optional[int]]:
+        """Returns at most ``limit`` namespaced node ids greater than ``cursor``
+        matching the filters, and the cursor of the next page or None if it is the last one"""
+        first_shard = 0 if cursor is None else cursor // NODE_ID_SHARD_SIZE
+        node_ids: List[int] = []
+        for shard_index in range(first_shard, len(self.shards)):
+            local_cursor = None
+            if cursor is not None and shard_index == first_shard:
+                local_cursor = cursor % NODE_ID_SHARD_SIZE
+            # one more node than asked tells if there is a next page
+            local_ids = self.shards[shard_index].index.page(
+                local_cursor, limit + 1 - len(node_ids), filters)
+            node_ids.extend(
+                shard_index * NODE_ID_SHARD_SIZE + local_id
+                for local_id in local_ids)
+            if len(node_ids) > limit:
+                return node_ids[:limit], node_ids[limit - 1]
+        return node_ids, None
+
+    async def wait_connected(self):
+        """Waits until the clients listen to all the Serveurs"""
+        await gather(*(shard.wait_connected() for shard in self.shards))
+
+    async def start(self, wait_nodes: bool = True, timeout: float = SHARD_START_TIMEOUT):
+        """connect to all the Serveurs and get their matter nodes list.
+        If ``wait_nodes`` is False, the nodes are fetched in the background.
+        Otherwise they are waited for at most ``timeout`` seconds, so that an unreachable
+        Serveur does not keep the others from being served."""
+        for shard in self.shards:
+            await shard.start(wait=False)
+        if not wait_nodes:
+            return
+        waiters = {
+            create_task(shard.wait_nodes()): shard_index
+            for shard_index, shard in enumerate(self.shards)}
+        _, pending = await wait(waiters.keys(), timeout=timeout)
+        for waiter in pending:
+            waiter.cancel()
+            logging.warning(
+                'nodes of shard %d not fetched after %.1fs, served once they are',
+                waiters[waiter], timeout)
+        logging.debug('%d shards started', len(self.shards) - len(pending))
+
+    async def wait_stop(self):
+        """wait for all the Serveur connections to stop"""
+        await gather(*(shard.wait_stop() for shard in self.shards))
+
+    async def drain(self, timeout: float) -> List[str]:
+        """Waits for the pending event deliveries of all the shards and cancels the ones
+        still running after ``timeout`` seconds. Returns the names of the cancelled ones."""
+        cancelled = await gather(*(shard.drain(timeout) for shard in self.shards))
+        return [name for names in cancelled for name in names]
+
+    async def stop(self):
+        """Disconnects from all the Serveurs"""
+        await gather(*(shard.stop() for shard in self.shards))
+
+    async def send_cluster_command(self, node_id: int, endpoint_id: int, command: ClusterCommand):
+        """Sends a cluster command to an endpoint of a matter node"""
+        shard, local_id = self._route(node_id)
+        return await shard.send_cluster_command(local_id, endpoint_id, command)
+
+    async def read_cluster_attribute(
+            self,
+            node_id: int,
+            endpoint_id: int,
+            cluster_id: int,
+            attribute_id: int) -> Any:
+        """Reads an attribute from the shard owning the node"""
+        shard, local_id = self._route(node_id)
+        return await shard.read_cluster_attribute(
+            local_id, endpoint_id, cluster_id, attribute_id)
+
+    async def read_cluster_attributes(
+            self,
+            node_id: int,
+            endpoint_id: int,
+            cluster_id: int) -> Dict[int, Any]:
+        """Reads all the attributes of a cluster from the shard owning the node"""
+        shard, local_id = self._route(node_id)
+        return await shard.read_cluster_attributes(local_id, endpoint_id, cluster_id)
+
+    async def write_cluster_attribute(
+            self,
+            node_id: int,
+            endpoint_id: int,
+            cluster_id: int,
+            attribute_id: int,
+            value: Any) -> Any:
+        """Writes an attribute on the shard owning the node"""
+        shard, local_id = self._route(node_id)
+        return await shard.write_cluster_attribute(
+            local_id, endpoint_id, cluster_id, attribute_id, value)
+
+    def subscribe_to_event(
+            self,
+            node_id: int,
+            endpoint_id: int,
+            cluster_id: int,
+            event_id: int,
+            callback: Callable[[MatterNodeEvent], None]) -> Callable[[], None]:
+        """Subscribes to an event. Returns an unsubscribe handler. The callback can be a coroutine.
+        The events given to the callback carry the namespaced node id."""
+        shard, local_id = self._route(node_id)
+        return shard.subscribe_to_event(
+            local_id, endpoint_id, cluster_id, event_id, callback)
+
+    def subscribe_to_attribute(
+            self,
+            node_id: int,
+            endpoint_id: int,
+            cluster_id: int,
+            attribute_id: int,
+            callback: Callable[[Any], None]) -> Callable[[], None]:
+        """Subscribes to the updates of an attribute. Returns an unsubscribe handler."""
+        shard, local_id = self._route(node_id)
+        return shard.subscribe_to_attribute(
+            local_id, endpoint_id, cluster_id, attribute_id, callback)
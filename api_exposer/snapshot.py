@@ -0,0 +1,117 @@
+"""Saves and loads a snapshot of the fabric for warm restarts"""
+
+import hashlib
+import json
+import logging
+import mmap
+import os
+import tempfile
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from matter_server.common.helpers.util import dataclass_from_dict
+from matter_server.common.models import MatterNodeData
+
+from api_exposer.features import FeatureFilter
+from api_exposer.serializer import to_jsonable
+
+SNAPSHOT_VERSION = 3
+
+
+@dataclass
+class Snapshot:
+    """
+    The node model and the rendered documentations.
+    Both of them are keyed by namespaced node id.
+    """
+    nodes: Dict[int, MatterNodeData] = field(default_factory=dict)
+    docs: Dict[int, str] = field(default_factory=dict)
+
+
+def docs_fingerprint(template_folder: str, features: FeatureFilter) -> str:
+    """Returns a digest of what the documentations are rendered from:
+    the templates of ``template_folder`` and the exposed features"""
+    digest = hashlib.sha256()
+    for directory, folders, names in os.walk(template_folder):
+        folders.sort()
+        for name in sorted(names):
+            template_path = os.path.join(directory, name)
+            digest.update(os.path.relpath(template_path, template_folder).encode('utf-8'))
+            with open(template_path, 'rb') as file:
+                digest.update(file.read())
+    digest.update(features.fingerprint().encode('utf-8'))
+    return digest.hexdigest()
+
+
+def encode_snapshot(snapshot: Snapshot, fingerprint: str) -> List[bytes]:
+    """Returns the chunks of the snapshot file.
+    The file starts with a json header line, followed by the documentations,
+    so that they are sliced out of the file instead of being json decoded.
+    ``fingerprint`` tells which templates and features rendered the documentations."""
+    docs = [(node_id, doc.encode('utf-8')) for node_id, doc in snapshot.docs.items()]
+    offsets: Dict[int, List[int]] = {}
+    offset = 0
+    for node_id, doc in docs:
+        offsets[node_id] = [offset, len(doc)]
+        offset += len(doc)
+
+    header = json.dumps({
+        'version': SNAPSHOT_VERSION,
+        'fingerprint': fingerprint,
+        'nodes': {
+            node_id: to_jsonable(node_data)
+            for node_id, node_data in snapshot.nodes.items()},
+        'docs': offsets,
+    }, separators=(',', ':'))
+    return [header.encode('utf-8'), b'\n', *(doc for _, doc in docs)]
+
+
+def write_snapshot(path: str, chunks: List[bytes]):
+    """Writes an encoded snapshot atomically.
+    Each write has its own temporary file, so concurrent writes never mix."""
+    descriptor, temporary_path = tempfile.mkstemp(
+        prefix=f'{os.path.basename(path)}.', suffix='.tmp',
+        dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(descriptor, 'wb') as file:
+            file.writelines(chunks)
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.unlink(temporary_path)
+        raise
+    logging.debug('snapshot saved to %s', path)
+
+
+def load_snapshot(path: str, fingerprint: str) -> Optional[Snapshot]:
+    """Reads a snapshot through a memory map, returns None if there is none.
+    The documentations are dropped if they were rendered with other templates or features."""
+    try:
+        with open(path, 'rb') as file, \
+                mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            header_end = mapped.find(b'\n')
+            header = json.loads(mapped[:header_end])
+            if header.get('version', None) != SNAPSHOT_VERSION:
+                logging.warning('snapshot %s has an unknown version', path)
+                return None
+
+            docs_start = header_end + 1
+            if header.get('fingerprint', None) == fingerprint:
+                docs = {
+                    int(node_id): mapped[docs_start + offset:docs_start + offset + length].decode('utf-8')
+                    for node_id, (offset, length) in header['docs'].items()}
+            else:
+                logging.info('documentations of snapshot %s are outdated', path)
+                docs = {}
+    except (OSError, ValueError, KeyError) as err:
+        logging.warning('snapshot %s not loaded : %s', path, err)
+        return None
+
+    nodes: Dict[int, MatterNodeData] = {}
+    for node_id, node_data in header.get('nodes', {}).items():
+        try:
+            nodes[int(node_id)] = dataclass_from_dict(MatterNodeData, node_data)
+        except Exception as err:  # pylint: disable=broad-exception-caught
+            # the node is fetched again from its Serveur
+            logging.warning('node %s of snapshot %s not loaded : %s', node_id, path, err)
+    logging.info('snapshot of %d nodes loaded from %s', len(nodes), path)
+    return Snapshot(nodes, docs)
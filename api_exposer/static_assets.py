@@ -0,0 +1,129 @@
+"""Serves pre-compressed static assets under content-hashed urls"""
+
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from api_exposer.const import STATIC_GZIP_LEVEL, STATIC_BROTLI_QUALITY, DYNAMIC_GZIP_LEVEL, DYNAMIC_BROTLI_QUALITY
+
+IDENTITY = 'identity'
+GZIP = 'gzip'
+BROTLI = 'br'
+
+# the source maps are unknown to mimetypes
+mimetypes.add_type('application/json', '.map')
+
+# by order of preference
+ENCODINGS: Tuple[str, ...] = (BROTLI, GZIP) if brotli is not None else (GZIP,)
+
+
+def compress(body: bytes, encoding: str, static: bool = False) -> bytes:
+    """Compresses a body with the given content encoding.
+    Static bodies are compressed once, so they use the highest levels."""
+    match encoding:
+        case 'gzip':
+            return gzip.compress(
+                body, STATIC_GZIP_LEVEL if static else DYNAMIC_GZIP_LEVEL, mtime=0)
+        case 'br':
+            return brotli.compress(
+                body, quality=STATIC_BROTLI_QUALITY if static else DYNAMIC_BROTLI_QUALITY)
+        case _:
+            return body
+
+
+def negotiate_encoding(accept_encoding: str, available: Iterable[str] = ENCODINGS) -> str:
+    """Returns the preferred available encoding accepted by an Accept-Encoding header"""
+    accepted: Dict[str, float] = {}
+    for item in accept_encoding.split(','):
+        name, _, parameters = item.strip().partition(';')
+        quality = 1.0
+        parameters = parameters.strip()
+        if parameters.startswith('q='):
+            try:
+                quality = float(parameters[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+
+    for encoding in ENCODINGS:
+        if encoding in available and accepted.get(encoding, accepted.get('*', 0.0)) > 0.0:
+            return encoding
+    return IDENTITY
+
+
+@dataclass
+class Asset:
+    """A static file and its compressed variants by content encoding"""
+    digest: str
+    media_type: str
+    variants: Dict[str, bytes]
+
+
+class CompressedAssets:
+    """
+    Static files compressed once with every available encoding.
+    Their urls contain a hash of their content so they can be cached forever.
+    """
+
+    def __init__(self, url_prefix: str, assets: Dict[str, Asset]):
+        self._url_prefix = url_prefix
+        self._assets = assets
+
+    @staticmethod
+    def _compress(name: str, body: bytes, digest: str, static: bool) -> Asset:
+        variants = {IDENTITY: body}
+        for encoding in ENCODINGS:
+            compressed = compress(body, encoding, static)
+            # already compressed files, like images, are kept as is
+            if len(compressed) < len(body):
+                variants[encoding] = compressed
+        logging.debug(
+            'asset %s compressed %s',
+            name,
+            {encoding: len(variant) for encoding, variant in variants.items()})
+        return Asset(
+            digest,
+            mimetypes.guess_type(name)[0] or 'application/octet-stream',
+            variants)
+
+    @classmethod
+    def build(cls, directory: str, names: List[str], url_prefix: str) -> 'CompressedAssets':
+        """Reads and compresses the files ``names`` of ``directory``.
+        The source map of a file is served next to it, under the same digest,
+        since the file refers to it with a relative url."""
+        assets: Dict[str, Asset] = {}
+        for name in names:
+            with open(os.path.join(directory, name), 'rb') as file:
+                body = file.read()
+            digest = hashlib.sha256(body).hexdigest()[:16]
+            assets[name] = cls._compress(name, body, digest, static=True)
+
+            map_name = f'{name}.map'
+            try:
+                with open(os.path.join(directory, map_name), 'rb') as file:
+                    map_body = file.read()
+            except FileNotFoundError:
+                continue
+            # only opened by the developer tools, not worth the highest levels
+            assets[map_name] = cls._compress(map_name, map_body, digest, static=False)
+        return cls(url_prefix, assets)
+
+    def url(self, name: str) -> str:
+        """Returns the content-hashed url of an asset"""
+        return f'{self._url_prefix}/{self._assets[name].digest}/{name}'
+
+    def get(self, name: str, digest: str) -> Optional[Asset]:
+        """Returns the asset if its digest is the current one"""
+        asset = self._assets.get(name, None)
+        if asset is None or asset.digest != digest:
+            return None
+        return asset
@@ -0,0 +1,91 @@
+"""Contains the persistent store of the event subscriptions"""
+
+import logging
+import sqlite3
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+SUBSCRIPTION_FIELDS = (
+    'node_id',
+    'endpoint_id',
+    'cluster_name',
+    'event_name',
+    'callback_name',
+    'callback_url',
+)
+
+
+class SubscriptionStore:
+    """
+    Stores the event subscriptions in a SQLite file so that they survive restarts.
+    Each subscription is keyed by its event path.
+    The connection is bound to the thread creating the store,
+    so it is only used from the event loop.
+    """
+
+    def __init__(self, path: str):
+        self._connection = sqlite3.connect(path)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS subscriptions ('
+            ' path TEXT PRIMARY KEY,'
+            ' node_id INTEGER NOT NULL,'
+            ' endpoint_id INTEGER NOT NULL,'
+            ' cluster_name TEXT NOT NULL,'
+            ' event_name TEXT NOT NULL,'
+            ' callback_name TEXT NOT NULL,'
+            ' callback_url TEXT NOT NULL)')
+        self._connection.execute(
+            'CREATE INDEX IF NOT EXISTS subscriptions_node_id'
+            ' ON subscriptions (node_id, path)')
+        self._connection.commit()
+
+    def add(self, path: str, subscription: Dict[str, Any]):
+        """Stores a subscription"""
+        with self._connection:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO subscriptions VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (path, *(subscription[name] for name in SUBSCRIPTION_FIELDS)))
+
+    def remove(self, path: str) -> bool:
+        """Removes a subscription, returns False if it was not stored"""
+        with self._connection:
+            cursor = self._connection.execute(
+                'DELETE FROM subscriptions WHERE path = ?', (path,))
+        return cursor.rowcount > 0
+
+    def page(
+            self,
+            cursor: Optional[str],
+            limit: int,
+            node_id: Optional[int] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Returns at most ``limit`` subscriptions after the ``cursor`` path
+        and the cursor of the next page, None if it is the last one"""
+        query = f'SELECT path, {", ".join(SUBSCRIPTION_FIELDS)} FROM subscriptions WHERE path > ?'
+        parameters: List[Any] = [cursor or '']
+        if node_id is not None:
+            query += ' AND node_id = ?'
+            parameters.append(node_id)
+        query += ' ORDER BY path LIMIT ?'
+        parameters.append(limit + 1)
+
+        rows = self._connection.execute(query, parameters).fetchall()
+        subscriptions = [
+            dict(zip(SUBSCRIPTION_FIELDS, row[1:]))
+            for row in rows[:limit]]
+        next_cursor = rows[limit - 1][0] if len(rows) > limit else None
+        return subscriptions, next_cursor
+
+    def batches(self, size: int) -> Iterator[List[Dict[str, Any]]]:
+        """Yields all the subscriptions by batches of ``size``"""
+        cursor = None
+        while True:
+            subscriptions, cursor = self.page(cursor, size)
+            if subscriptions:
+                yield subscriptions
+            if cursor is None:
+                return
+
+    def close(self):
+        """Closes the SQLite file"""
+        self._connection.close()
+        logging.debug('subscription store closed')
@@ -11,7 +11,9 @@ from chip.clusters.ClusterObjects import Cluster, ClusterCommand, ClusterEvent
 from chip.clusters import Objects
 from matter_server.client.models.node import MatterNode, MatterEndpoint
 
-from api_exposer.my_client import MyClient
+from api_exposer.command_builder import CommandBuilders, CommandArgumentError
+from api_exposer.features import FeatureFilter, ALL_FEATURES
+from api_exposer.sharded_client import ShardedClient
 
 
 ClusterInfo = Dict[str, Any]
@@ -27,7 +29,7 @@ def not_found(msg: str) -> None:
     raise HTTPException(404, msg)
 
 
-def validate_node_id(client: MyClient, node_id: int) -> MatterNode:
+def validate_node_id(client: ShardedClient, node_id: int) -> MatterNode:
     """Returns the node if found otherwise raise HTTPException"""
     if node_id not in client.nodes:
         not_found(f'node {node_id} not found')
@@ -41,8 +43,13 @@ def validate_endpoint_id(node: MatterNode, endpoint_id: int) -> MatterEndpoint:
     return node.endpoints[endpoint_id]
 
 
-def validate_cluster_name(endpoint: MatterEndpoint, cluster_name: str) -> Cluster:
+def validate_cluster_name(
+        endpoint: MatterEndpoint,
+        cluster_name: str,
+        features: FeatureFilter = ALL_FEATURES) -> Cluster:
     """Returns the cluster if found otherwise raise HTTPException"""
+    if not features.allows_cluster(cluster_name):
+        not_found(f'cluster {cluster_name} not found')
     if not hasattr(Objects, cluster_name):
         not_found(f'cluster {cluster_name} not found')
     cluster_class = getattr(Objects, cluster_name)
@@ -56,8 +63,13 @@ def validate_cluster_name(endpoint: MatterEndpoint, cluster_name: str) -> Cluste
     return endpoint.clusters[cluster_id]
 
 
-def validate_command_name(cluster: Cluster, command_name: str) -> type[ClusterCommand]:
+def validate_command_name(
+        cluster: Cluster,
+        command_name: str,
+        features: FeatureFilter = ALL_FEATURES) -> type[ClusterCommand]:
     """Returns the command class if found otherwise raise HTTPException"""
+    if not features.allows_command(cluster.__class__.__name__, command_name):
+        not_found(f'command {command_name} not found')
     if not hasattr(cluster, 'Commands'):
         not_found('cluster does not have commands')
     if not hasattr(cluster.Commands, command_name):
@@ -65,17 +77,28 @@ def validate_command_name(cluster: Cluster, command_name: str) -> type[ClusterCo
     return getattr(cluster.Commands, command_name)
 
 
-def validate_event_name(cluster: Cluster, event_name: str) -> Type[ClusterEvent]:
+def validate_event_name(
+        cluster: Cluster,
+        event_name: str,
+        features: FeatureFilter = ALL_FEATURES) -> Type[ClusterEvent]:
     """Returns the event if found otherwise raise HTTPException"""
+    if not features.allows_event(cluster.__class__.__name__, event_name):
+        not_found(f'event {event_name} not found')
     if not hasattr(cluster, 'Events'):
         not_found('cluster does not have events')
     if not hasattr(cluster.Events, event_name):
-        not_found(f'command {event_name} not found')
+        not_found(f'event {event_name} not found')
     return getattr(cluster.Events, event_name)
 
 
-def validate_attribute_name(cluster_infos: ChipClusters, cluster: Cluster, attribute_name: str) -> AttributeInfo:
+def validate_attribute_name(
+        cluster_infos: ChipClusters,
+        cluster: Cluster,
+        attribute_name: str,
+        features: FeatureFilter = ALL_FEATURES) -> AttributeInfo:
     """Returns the attribute if found otherwise raise HTTPException"""
+    if not features.allows_attribute(cluster.__class__.__name__, attribute_name):
+        not_found(f'cluster does not have {attribute_name}')
     # field = cluster.descriptor.GetFieldByLabel(attribute_name)
     # if field is None:
     #     not_found(f'cluster does not have {attribute_name}')
@@ -107,3 +130,15 @@ def validate_json_attribute(json_object: Dict[str, Any], attribute_name: str) ->
         raise HTTPException(400, "malformed json")
 
     return result
+
+
+def validate_command_parameters(
+        command_builders: CommandBuilders,
+        command_class: type[ClusterCommand],
+        command_parameters: Dict[str, Any]) -> ClusterCommand:
+    """Returns the command built from its parameters or else raise HTTPException"""
+    try:
+        return command_builders.build(command_class, command_parameters)
+    except CommandArgumentError as err:
+        logging.info('invalid %s parameters : %s', command_class.__name__, err)
+        raise HTTPException(400, f'invalid parameters, {err}') from err
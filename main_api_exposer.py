@@ -1,30 +1,41 @@
 """This is the entry point of the server."""
 
 import logging
-import tempfile
-import shutil
-from typing import AsyncGenerator, Callable, Coroutine, Dict, Any
-from dataclasses import asdict
-from asyncio import run, sleep
+from typing import AsyncGenerator, Awaitable, Callable, Coroutine, Dict, Any, Hashable, Optional, Set
+from time import time
+from asyncio import Task, create_task, gather, get_running_loop, run, sleep, to_thread
 
 from httpx import AsyncClient
 # web python server
 from uvicorn import Server, Config
+from fastapi import Query
 from fastapi.applications import FastAPI
 from fastapi.requests import Request
 from fastapi.exceptions import HTTPException
 from fastapi.responses import Response, RedirectResponse, HTMLResponse, JSONResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
-from playsound import playsound
 
 # templating
 from jinja2 import Environment, select_autoescape, FileSystemLoader
 
 from chip.clusters.CHIPClusters import ChipClusters
+from matter_server.client.models.node import MatterNode
 
-from api_exposer.my_client import MyClient
+from api_exposer.sharded_client import ShardedClient
+from api_exposer.my_client import ServerUnavailableError
 from api_exposer.renderer import Renderer
+from api_exposer.features import FeatureFilter
+from api_exposer.command_builder import CommandBuilders
+from api_exposer.serializer import encode, encode_shared
+from api_exposer.history import HistoryStore, NUMERIC_TYPES
+from api_exposer.snapshot import Snapshot, docs_fingerprint, load_snapshot, encode_snapshot, write_snapshot
+from api_exposer.subscription_store import SubscriptionStore
+from api_exposer.coalescer import WriteCoalescer
+from api_exposer.node_index import NodeFilters, node_summary
+from api_exposer.notifier import SoundNotifier
+from api_exposer.reader import Reader
+from api_exposer.static_assets import CompressedAssets, IDENTITY, compress, negotiate_encoding
 from api_exposer.validator import (
     validate_node_id,
     validate_endpoint_id,
@@ -32,23 +43,59 @@ from api_exposer.validator import (
     validate_event_name,
     validate_attribute_name,
     validate_command_name,
+    validate_command_parameters,
     validate_json_body,
     validate_json_attribute)
 from api_exposer.argument_parser import parse_args
-from api_exposer.const import SWAGGER_TEMPLATE_FOLDER, SWAGGER_HTML_FOLDER, STATIC_FOLDER
+from api_exposer.const import (
+    SWAGGER_TEMPLATE_FOLDER,
+    SWAGGER_HTML_FOLDER,
+    STATIC_FOLDER,
+    SWAGGER_STATIC_FOLDER,
+    SWAGGER_ASSETS,
+    SUBSCRIPTION_RESTORE_BATCH_SIZE,
+    COALESCED_COMMANDS,
+    DEFAULT_SUBSCRIPTION_PAGE_SIZE,
+    DEFAULT_NODE_PAGE_SIZE,
+    NOTIFICATION_SOUND_FILE,
+    NOTIFICATION_MIN_INTERVAL,
+    NOTIFICATION_MAX_QUEUED)
 
 SWAGGER_PATH = 'html/swagger'
+ASSETS_PATH = '/assets/swagger'
 ATTRIBUTE_LIST_ID = 0x0000FFFB
 ACCEPTED_COMMAND_LIST_ID = 0x0000FFF9
 EVENT_LIST_ID = 0x0000FFFA
+JSON_MEDIA_TYPE = 'application/json'
+
+
+def _split_fields(fields: Optional[str]) -> Optional[Set[str]]:
+    """Returns the names of a comma separated ``fields`` projection, None if not given"""
+    if fields is None:
+        return None
+    return {name.strip() for name in fields.split(',') if name.strip()}
+
+
+def _json_response(content: Any) -> Response:
+    """Returns a json response encoded with the matter aware serializer"""
+    return Response(content=encode(content), media_type=JSON_MEDIA_TYPE)
+
+
+class DrainingServer(Server):
+    """A uvicorn server recording when its shutdown starts,
+    so that the webhook deliveries are drained within the same deadline"""
+    shutdown_started: Optional[float] = None
+
+    async def shutdown(self, sockets=None):
+        self.shutdown_started = get_running_loop().time()
+        await super().shutdown(sockets)
 
 
 async def main():
     """The main function of the server"""
     args = parse_args()
 
-    client = MyClient(args.url)
-    await client.start()
+    client = ShardedClient(args.urls)
     nodes = client.nodes
 
     app = FastAPI()
@@ -60,15 +107,65 @@ async def main():
         autoescape=select_autoescape()
     )
 
+    features = FeatureFilter.load(args.features_file)
+    command_builders = CommandBuilders.precompile(features)
+
     cluster_infos = ChipClusters(None)
     convertor = Renderer(
         client,
         cluster_infos,
         ATTRIBUTE_LIST_ID,
-        ACCEPTED_COMMAND_LIST_ID)
+        ACCEPTED_COMMAND_LIST_ID,
+        features)
+    reader = Reader(client, cluster_infos, ATTRIBUTE_LIST_ID, features)
+
+    fingerprint = docs_fingerprint(SWAGGER_TEMPLATE_FOLDER, features)
+    snapshot = load_snapshot(args.snapshot_file, fingerprint) if args.snapshot_file else None
+    if snapshot is not None:
+        client.load_nodes({
+            node_id: MatterNode(node_data)
+            for node_id, node_data in snapshot.nodes.items()})
+        convertor.import_docs(snapshot.docs)
+    client.subscribe_to_nodes(convertor.invalidate)
+    # with a snapshot the server is served right away
+    # and the nodes are reconciled in the background
+    await client.start(wait_nodes=snapshot is None)
+
+    # compressed once, in a thread to let the nodes be reconciled meanwhile
+    assets = await to_thread(
+        CompressedAssets.build, SWAGGER_STATIC_FOLDER, SWAGGER_ASSETS, ASSETS_PATH)
+
+    # shared by all the webhooks to reuse the connections
+    webhooks = AsyncClient()
 
     event_subscribers: Dict[str, Callable[[], None]] = {}
+    subscription_store = SubscriptionStore(args.subscriptions_file)
+    # the stored subscriptions not restored yet, by node id and path
+    pending_subscriptions: Dict[int, Dict[str, Dict[str, Any]]] = {}
     attribute_subscribers: Dict[str, Callable[[], None]] = {}
+    notifier = SoundNotifier(
+        NOTIFICATION_SOUND_FILE,
+        NOTIFICATION_MIN_INTERVAL,
+        NOTIFICATION_MAX_QUEUED)
+    notifier.start()
+    coalescer = WriteCoalescer() if args.coalesce_writes else None
+    histories = HistoryStore(
+        client,
+        dict(args.history_retention),
+        args.history_default_retention,
+        args.history_capacity)
+
+    async def _write(key: Hashable, send: Callable[[], Awaitable[Any]]) -> Any:
+        """Sends a write, coalesced with the other writes to the same target if enabled"""
+        if coalescer is None:
+            return await send()
+        return await coalescer.submit(key, send)
+
+    @app.exception_handler(ServerUnavailableError)
+    async def server_unavailable(request: Request, err: ServerUnavailableError) -> Response:
+        """Answers 503 when the matter server of a node is not connected"""
+        logging.warning('%s %s : %s', request.method, request.url.path, err)
+        return JSONResponse({'detail': str(err)}, status_code=503)
 
     @app.get('/')
     def redirect():
@@ -89,6 +186,24 @@ async def main():
             }
         )
 
+    @app.get('/api/v1/nodes')
+    async def list_nodes(
+            cursor: Optional[int] = Query(None, ge=0),
+            limit: int = Query(DEFAULT_NODE_PAGE_SIZE, gt=0, le=1000),
+            device_type: Optional[int] = None,
+            cluster_id: Optional[int] = None,
+            vendor_id: Optional[int] = None,
+            available: Optional[bool] = None):
+        """Returns a page of the nodes matching the filters and the cursor of the next page"""
+        node_ids, next_cursor = client.page_nodes(
+            cursor,
+            limit,
+            NodeFilters(device_type, cluster_id, vendor_id, available))
+        return _json_response({
+            'nodes': [node_summary(node_id, nodes[node_id]) for node_id in node_ids],
+            'next_cursor': next_cursor,
+        })
+
     @app.get(f'/{SWAGGER_PATH}/{{node_id}}')
     def swagger_ui(request: Request, node_id: int):
         """Dynamically renders a swagger ui with the correct documentation"""
@@ -96,26 +211,57 @@ async def main():
         return html_template.TemplateResponse(
             request=request,
             name='swagger.html',
-            context={'node_id': node_id}
+            context={'node_id': node_id, 'assets': assets}
         )
 
+    @app.get(f'{ASSETS_PATH}/{{digest}}/{{name}}')
+    def swagger_asset(request: Request, digest: str, name: str):
+        """Returns a pre-compressed swagger asset, cached forever by the browsers
+        since its url changes with its content"""
+        asset = assets.get(name, digest)
+        if asset is None:
+            raise HTTPException(404, f'asset {name} not found')
+        encoding = negotiate_encoding(
+            request.headers.get('accept-encoding', ''), asset.variants.keys())
+        headers = {
+            'Cache-Control': 'public, max-age=31536000, immutable',
+            'ETag': f'"{digest}"',
+            'Vary': 'Accept-Encoding',
+        }
+        if encoding != IDENTITY:
+            headers['Content-Encoding'] = encoding
+        return Response(
+            content=asset.variants[encoding],
+            media_type=asset.media_type,
+            headers=headers)
+
     @app.get('/api/doc/{node_id}')
     async def node_api_documentation(request: Request, node_id: int) -> str:
         """Returns an OpenAPI documentation in yaml format for a matter node"""
         node = validate_node_id(client, node_id)
-        cluster_paths = await convertor.render_node(node)
-
-        content = env.get_template('swagger.yml.j2').render({
-            'server_ip': request.url.hostname,
-            'server_port': request.url.port,
-            'paths': cluster_paths
-        })
+        encoding = negotiate_encoding(request.headers.get('accept-encoding', ''))
+        # the document embeds the server address the client used
+        variant = (request.url.hostname, request.url.port, encoding)
+        body = convertor.get_body(node_id, variant)
+        if body is None:
+            cluster_paths = await convertor.render_node(node_id, node)
+            content = env.get_template('swagger.yml.j2').render({
+                'server_ip': request.url.hostname,
+                'server_port': request.url.port,
+                'paths': cluster_paths
+            })
+            body = compress(content.encode('utf-8'), encoding)
+            convertor.keep_body(node_id, variant, body)
+        headers = {
+            'Cache-control': 'no-cache',
+            'Vary': 'Accept-Encoding',
+        }
+        if encoding != IDENTITY:
+            headers['Content-Encoding'] = encoding
         return Response(
             media_type='application/yaml',
-            content=content,
-            headers={
-                'Cache-control': 'no-cache'
-            }
+            content=body,
+            headers=headers
         )
 
     @app.post('/echo')
@@ -124,14 +270,12 @@ async def main():
         print(await validate_json_body(request))
 
     @app.post('/dingdong')
-    def dingdong() -> None:
-        """Plays a dingdong sound"""
-        with tempfile.TemporaryDirectory() as directory:
-            filename = shutil.copy2(
-                './attention_tone_sm30-96953.mp3',
-                directory)
-            logging.info('Playing sound %s', filename)
-            playsound(filename)
+    async def dingdong() -> None:
+        """Queues a dingdong sound, played off the event loop"""
+        if not notifier.available:
+            raise HTTPException(503, 'dingdong sound not loaded')
+        if not notifier.trigger():
+            raise HTTPException(429, 'too many dingdong queued')
 
     def _event_path(
             node_id: int,
@@ -141,6 +285,42 @@ async def main():
             callback_name: str) -> str:
         return f'{node_id}/{endpoint_id}/{cluster_name}/{event_name}/{callback_name}'
 
+    def _subscribe(subscription: Dict[str, Any]) -> str:
+        """Subscribes the callback url of a subscription to its event, returns its path"""
+        node = validate_node_id(client, subscription['node_id'])
+        endpoint = validate_endpoint_id(node, subscription['endpoint_id'])
+        cluster = validate_cluster_name(
+            endpoint, subscription['cluster_name'], features)
+        event = validate_event_name(
+            cluster, subscription['event_name'], features)
+        path = _event_path(
+            subscription['node_id'],
+            subscription['endpoint_id'],
+            subscription['cluster_name'],
+            subscription['event_name'],
+            subscription['callback_name'])
+        callback_url = subscription['callback_url']
+
+        async def callback(data):
+            content = encode_shared(data)
+            logging.debug('calling %s with %s', callback_url, content)
+            await webhooks.post(
+                callback_url,
+                content=content,
+                headers={'Content-Type': JSON_MEDIA_TYPE})
+
+        if path in event_subscribers:
+            raise HTTPException(
+                400, f'callback {subscription["callback_name"]} already exist')
+        event_subscribers[path] = client.subscribe_to_event(
+            subscription['node_id'],
+            subscription['endpoint_id'],
+            cluster.id,
+            event.event_id,
+            callback)
+        logging.debug('there is %d subscribers', len(event_subscribers))
+        return path
+
     @app.post('/api/v1/{node_id}/{endpoint_id}/{cluster_name}/subscribe/event/{event_name}')
     async def subscribe_to_event(
             request: Request,
@@ -150,33 +330,39 @@ async def main():
             event_name: str):
         """Adds an URL to the subscription list of the event to be called with a POST request when an event is updated."""
         json_body = await validate_json_body(request)
-        callback_name = validate_json_attribute(json_body, 'callback_name')
-        callback_url = validate_json_attribute(json_body, 'callback_url')
-        node = validate_node_id(client, node_id)
-        endpoint = validate_endpoint_id(node, endpoint_id)
-        cluster = validate_cluster_name(endpoint, cluster_name)
-        event = validate_event_name(cluster, event_name)
-        path = _event_path(
-            node_id,
-            endpoint_id,
-            cluster_name,
-            event_name,
-            callback_name)
-
-        async def callback(data):
-            json_data = asdict(data)
-            logging.debug('calling %s with %s', callback_url, json_data)
-            async with AsyncClient() as client:
-                await client.post(callback_url, json=json_data)
-
-        if path in event_subscribers:
-            raise HTTPException(400, f'callback {callback_name} already exist')
-        event_subscribers[path] = client.subscribe_to_event(
-            node_id, endpoint_id, cluster.id, event.event_id, callback)
-        logging.debug('there is %d subscribers', len(event_subscribers))
+        subscription = {
+            'node_id': node_id,
+            'endpoint_id': endpoint_id,
+            'cluster_name': cluster_name,
+            'event_name': event_name,
+            'callback_name': validate_json_attribute(json_body, 'callback_name'),
+            'callback_url': validate_json_attribute(json_body, 'callback_url'),
+        }
+        path = _subscribe(subscription)
+        subscription_store.add(path, subscription)
+
+    @app.get('/api/v1/subscriptions')
+    async def list_subscriptions(
+            cursor: Optional[str] = None,
+            limit: int = Query(DEFAULT_SUBSCRIPTION_PAGE_SIZE, gt=0, le=1000),
+            node_id: Optional[int] = None):
+        """Returns a page of the event subscriptions and the cursor of the next page"""
+        subscriptions, next_cursor = subscription_store.page(
+            cursor, limit, node_id)
+        for subscription in subscriptions:
+            subscription['active'] = _event_path(
+                subscription['node_id'],
+                subscription['endpoint_id'],
+                subscription['cluster_name'],
+                subscription['event_name'],
+                subscription['callback_name']) in event_subscribers
+        return _json_response({
+            'subscriptions': subscriptions,
+            'next_cursor': next_cursor,
+        })
 
     @app.delete('/api/v1/{node_id}/{endpoint_id}/{cluster_name}/subscribe/event/{event_name}/{callback_name}')
-    def unsubscribe_to_event(
+    async def unsubscribe_to_event(
             node_id: int,
             endpoint_id: int,
             cluster_name: str,
@@ -189,11 +375,42 @@ async def main():
             cluster_name,
             event_name,
             callback_name)
-        if path not in event_subscribers:
+        unsubscribe = event_subscribers.pop(path, None)
+        if unsubscribe is not None:
+            unsubscribe()
+        # a stored subscription is removed even if it was never restored
+        pending_subscriptions.get(node_id, {}).pop(path, None)
+        if not subscription_store.remove(path) and unsubscribe is None:
             logging.info('callback at %s not found', path)
             raise HTTPException(404, f'callback {callback_name} not found')
-        event_subscribers[path]()
-        del event_subscribers[path]
+
+    @app.get('/api/v1/{node_id}/{endpoint_id}')
+    async def get_endpoint(
+            node_id: int,
+            endpoint_id: int,
+            fields: Optional[str] = None):
+        """Returns all the attributes of all the clusters of a node's endpoint in json format.
+        ``fields`` is a comma separated list of ``Cluster`` or ``Cluster.attribute``"""
+        node = validate_node_id(client, node_id)
+        endpoint = validate_endpoint_id(node, endpoint_id)
+        values = await reader.read_endpoint(
+            node_id, node, endpoint, _split_fields(fields))
+        return _json_response(values)
+
+    @app.get('/api/v1/{node_id}/{endpoint_id}/{cluster_name}')
+    async def get_cluster(
+            node_id: int,
+            endpoint_id: int,
+            cluster_name: str,
+            fields: Optional[str] = None):
+        """Returns all the attributes of a node's endpoint cluster in json format.
+        ``fields`` is a comma separated list of attribute names"""
+        node = validate_node_id(client, node_id)
+        endpoint = validate_endpoint_id(node, endpoint_id)
+        cluster = validate_cluster_name(endpoint, cluster_name, features)
+        values = await reader.read_cluster(
+            node_id, node, endpoint_id, cluster, _split_fields(fields))
+        return _json_response(values)
 
     @app.get('/api/v1/{node_id}/{endpoint_id}/{cluster_name}/attribute/{attribute_name}')
     async def get_attribute(
@@ -204,12 +421,12 @@ async def main():
         """Returns an attribute of a node's endpoint in json format"""
         node = validate_node_id(client, node_id)
         endpoint = validate_endpoint_id(node, endpoint_id)
-        cluster = validate_cluster_name(endpoint, cluster_name)
+        cluster = validate_cluster_name(endpoint, cluster_name, features)
         attribute_info = validate_attribute_name(
-            cluster_infos, cluster, attribute_name)
+            cluster_infos, cluster, attribute_name, features)
         attribute = await client.read_cluster_attribute(
             node_id, endpoint_id, cluster.id, attribute_info.get('attributeId'))
-        return JSONResponse(content={attribute_name: attribute})
+        return _json_response({attribute_name: attribute})
 
     @app.patch('/api/v1/{node_id}/{endpoint_id}/{cluster_name}/attribute/{attribute_name}')
     async def set_attribute(
@@ -221,20 +438,76 @@ async def main():
         """Updates an attribute of a node's endpoint"""
         node = validate_node_id(client, node_id)
         endpoint = validate_endpoint_id(node, endpoint_id)
-        cluster = validate_cluster_name(endpoint, cluster_name)
+        cluster = validate_cluster_name(endpoint, cluster_name, features)
         attribute_info = validate_attribute_name(
-            cluster_infos, cluster, attribute_name)
+            cluster_infos, cluster, attribute_name, features)
 
         json_body = await validate_json_body(request)
         attribute_value = validate_json_attribute(json_body, attribute_name)
 
-        new_attribute = await client.write_cluster_attribute(
-            node_id,
-            endpoint_id,
-            cluster.id,
-            attribute_info.get('attributeId'),
-            attribute_value)
-        return JSONResponse(content={attribute_name: new_attribute})
+        new_attribute = await _write(
+            ('attribute', node_id, endpoint_id, cluster.id, attribute_name),
+            lambda: client.write_cluster_attribute(
+                node_id,
+                endpoint_id,
+                cluster.id,
+                attribute_info.get('attributeId'),
+                attribute_value))
+        return _json_response({attribute_name: new_attribute})
+
+    @app.post('/api/v1/{node_id}/{endpoint_id}/{cluster_name}/attribute/{attribute_name}/history')
+    async def record_attribute_history(
+            node_id: int,
+            endpoint_id: int,
+            cluster_name: str,
+            attribute_name: str):
+        """Starts recording the history of a numeric attribute"""
+        node = validate_node_id(client, node_id)
+        endpoint = validate_endpoint_id(node, endpoint_id)
+        cluster = validate_cluster_name(endpoint, cluster_name, features)
+        attribute_info = validate_attribute_name(
+            cluster_infos, cluster, attribute_name, features)
+        if attribute_info.get('type', None) not in NUMERIC_TYPES:
+            raise HTTPException(400, f'{attribute_name} is not numeric')
+        key = (node_id, endpoint_id, cluster_name, attribute_name)
+        if histories.get(key) is not None:
+            return
+        history = histories.record(
+            key, cluster.id, attribute_info.get('attributeId'))
+        # the first sample avoids an empty history until the next update
+        history.append(await client.read_cluster_attribute(
+            node_id, endpoint_id, cluster.id, attribute_info.get('attributeId')))
+
+    @app.get('/api/v1/{node_id}/{endpoint_id}/{cluster_name}/attribute/{attribute_name}/history')
+    async def get_attribute_history(
+            node_id: int,
+            endpoint_id: int,
+            cluster_name: str,
+            attribute_name: str,
+            start: Optional[float] = Query(None, alias='from'),
+            end: Optional[float] = Query(None, alias='to'),
+            step: Optional[float] = Query(None, gt=0)):
+        """Returns the recorded values of an attribute between two timestamps,
+        averaged in buckets of ``step`` seconds if given"""
+        key = (node_id, endpoint_id, cluster_name, attribute_name)
+        history = histories.get(key)
+        if history is None:
+            raise HTTPException(404, f'history of {attribute_name} not recorded')
+        end = time() if end is None else end
+        start = end - history.retention if start is None else start
+        timestamps, values = history.query(start, end, step)
+        return _json_response({'timestamps': timestamps, 'values': values})
+
+    @app.delete('/api/v1/{node_id}/{endpoint_id}/{cluster_name}/attribute/{attribute_name}/history')
+    async def stop_attribute_history(
+            node_id: int,
+            endpoint_id: int,
+            cluster_name: str,
+            attribute_name: str):
+        """Stops recording the history of an attribute and drops it"""
+        key = (node_id, endpoint_id, cluster_name, attribute_name)
+        if not histories.stop(key):
+            raise HTTPException(404, f'history of {attribute_name} not recorded')
 
     @app.post('/api/v1/{node_id}/{endpoint_id}/{cluster_name}/command/{command_name}')
     async def do_command(
@@ -248,28 +521,131 @@ async def main():
         node = validate_node_id(client, node_id)
         endpoint = validate_endpoint_id(node, endpoint_id)
         cluster = validate_cluster_name(
-            endpoint, cluster_name)
+            endpoint, cluster_name, features)
         command_class = validate_command_name(
-            cluster, command_name)
+            cluster, command_name, features)
 
         if (await request.body()) == b'':
-            command = command_class()
+            command_parameters: Dict[str, Any] = {}
         else:
-            command_parameters: Dict[str: Any] = await request.json()
-            # if not type(command_parameters) == dict:
-            #     # might not be true
-            #     _bad_request('command parameters must be an object')
-            command = command_class(**command_parameters)
+            command_parameters = await validate_json_body(request)
+        command = validate_command_parameters(
+            command_builders, command_class, command_parameters)
         try:
-            return await client.send_cluster_command(node_id, endpoint_id, command)
+            if command_name in COALESCED_COMMANDS:
+                result = await _write(
+                    ('command', node_id, endpoint_id, cluster.id, command_name),
+                    lambda: client.send_cluster_command(node_id, endpoint_id, command))
+            else:
+                result = await client.send_cluster_command(node_id, endpoint_id, command)
+        except ServerUnavailableError:
+            raise
         except Exception as err:
             logging.warning(
                 'Unexpected error while handling a matter cluster command : %s', str(err))
             raise HTTPException(500, str(err)) from err
-
-    config = Config(app, host='0.0.0.0', port=args.port, log_level='info')
-    server = Server(config)
-    await server.serve()
+        return _json_response(result)
+
+    def _snapshot() -> Snapshot:
+        return Snapshot(
+            {node_id: node.node_data for node_id, node in nodes.items()},
+            convertor.export_docs())
+
+    async def _restore_subscriptions():
+        """Restores the stored subscriptions by batches,
+        letting the server answer requests between two batches"""
+        restored = 0
+        for subscriptions in subscription_store.batches(SUBSCRIPTION_RESTORE_BATCH_SIZE):
+            for subscription in subscriptions:
+                try:
+                    _subscribe(subscription)
+                    restored += 1
+                except HTTPException as err:
+                    logging.warning(
+                        'subscription %s not restored until its node changes : %s',
+                        subscription, err.detail)
+                    path = _event_path(
+                        subscription['node_id'],
+                        subscription['endpoint_id'],
+                        subscription['cluster_name'],
+                        subscription['event_name'],
+                        subscription['callback_name'])
+                    pending_subscriptions.setdefault(
+                        subscription['node_id'], {})[path] = subscription
+            await sleep(0)
+        logging.info('%d subscriptions restored', restored)
+
+    def _retry_subscriptions(node_id: int):
+        """Restores the pending subscriptions of a node when it is added or updated"""
+        pending = pending_subscriptions.get(node_id, None)
+        if not pending or node_id not in nodes:
+            return
+        for path, subscription in list(pending.items()):
+            try:
+                _subscribe(subscription)
+            except HTTPException as err:
+                logging.debug('subscription %s still not restored : %s', path, err.detail)
+                continue
+            del pending[path]
+            logging.info('subscription %s restored', path)
+        if not pending:
+            del pending_subscriptions[node_id]
+
+    client.subscribe_to_nodes(_retry_subscriptions)
+
+    async def _save_snapshot_periodically():
+        while True:
+            await sleep(args.snapshot_interval)
+            # encoded in the event loop, the nodes being updated by it
+            chunks = encode_snapshot(_snapshot(), fingerprint)
+            await to_thread(write_snapshot, args.snapshot_file, chunks)
+
+    background_tasks: Set[Task] = set()
+    background_tasks.add(create_task(_restore_subscriptions()))
+    if args.snapshot_file:
+        background_tasks.add(create_task(_save_snapshot_periodically()))
+
+    async def _drain(timeout: float):
+        """Finishes the webhook deliveries within ``timeout`` seconds
+        and leaves the matter servers cleanly"""
+        # no new delivery can start while the pending ones are drained
+        for unsubscribe in event_subscribers.values():
+            unsubscribe()
+        event_subscribers.clear()
+        histories.stop_all()
+        dropped = await client.drain(timeout)
+        if dropped:
+            logging.warning(
+                '%d webhook deliveries dropped on shutdown : %s', len(dropped), dropped)
+        else:
+            logging.info('all webhook deliveries finished')
+        await client.stop()
+
+    # on SIGTERM uvicorn stops accepting connections
+    # and gives the in-flight requests the shutdown timeout to finish,
+    # the webhook deliveries get what is left of it
+    config = Config(
+        app,
+        host='0.0.0.0',
+        port=args.port,
+        log_level='info',
+        timeout_graceful_shutdown=args.shutdown_timeout)
+    server = DrainingServer(config)
+    try:
+        await server.serve()
+    finally:
+        for task in background_tasks:
+            task.cancel()
+        # a periodic save must not replace the final snapshot
+        await gather(*background_tasks, return_exceptions=True)
+        now = get_running_loop().time()
+        shutdown_started = now if server.shutdown_started is None else server.shutdown_started
+        await _drain(max(0.0, shutdown_started + args.shutdown_timeout - now))
+        if args.snapshot_file:
+            write_snapshot(args.snapshot_file, encode_snapshot(_snapshot(), fingerprint))
+        subscription_store.close()
+        await notifier.stop()
+        await webhooks.aclose()
 
 
 if __name__ == '__main__':